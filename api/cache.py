@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+API响应缓存策略
+只读且轮询频繁的端点使用进程内TTL缓存，按数据变化频率分级
+"""
+import asyncio
+from typing import Any, Dict, List
+from cachetools import TTLCache
+
+# 缓存时效分级 (秒)
+TTL_SHORT = 1.0     # 聚合状态，变化较快
+TTL_NORMAL = 5.0    # 设备列表等，很少变化
+
+# 可用设备列表 (枚举PortAudio设备开销较大，轮询间短时间复用)
+_available_devices_cache = TTLCache(maxsize=1, ttl=TTL_SHORT)
+_available_devices_lock = asyncio.Lock()  # 缓存失效时只让一个请求去枚举，其余等待复用结果
+
+async def get_available_devices_cached(device_manager) -> List[Dict[str, Any]]:
+    """获取可用设备列表，TTL_SHORT内复用上次的枚举结果（枚举在线程中执行）
+    
+    返回的是缓存中的列表，调用方如需修改请先复制
+    """
+    devices = _available_devices_cache.get("devices")
+    if devices is None:
+        async with _available_devices_lock:
+            devices = _available_devices_cache.get("devices")
+            if devices is None:
+                devices = await device_manager.get_available_devices_async()
+                _available_devices_cache["devices"] = devices
+    return devices
+
+def invalidate_available_devices():
+    """使可用设备列表缓存失效"""
+    _available_devices_cache.clear()
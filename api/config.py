@@ -2,306 +2,438 @@
 """
 动态配置控制API端点
 """
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel, Field
-from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.exceptions import RequestValidationError
+from .responses import NPResponse
+from pydantic import BaseModel
+from typing import Optional, Annotated, Any, Final, Mapping
+from types import MappingProxyType
+from dataclasses import dataclass
 import logging
+import re
+import msgspec
+from cachetools import TTLCache
+from .cache import TTL_SHORT
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/config", tags=["configuration"])
 
+@dataclass(slots=True, frozen=True)
+class Components:
+    """全局组件引用集合"""
+    audio_capture: Any
+    fft_processor: Any
+    data_streamer: Any
+    stream_config: Any
+    audio_config: Any
+
 # 全局组件引用 (将在main.py中设置)
-components = {}
+components: Optional[Components] = None
+
+# 当前配置缓存，配置更新时清空（不含frames_processed等实时计数）
+_current_config_cache = TTLCache(maxsize=1, ttl=TTL_SHORT)
+
+def invalidate_current_config():
+    """使当前配置缓存失效（其他模块修改stream_config/audio_config后调用）"""
+    _current_config_cache.clear()
 
 def set_config_components(audio_capture, fft_processor, data_streamer, stream_config, audio_config):
     """设置全局组件引用"""
     global components
-    components = {
-        'audio_capture': audio_capture,
-        'fft_processor': fft_processor, 
-        'data_streamer': data_streamer,
-        'stream_config': stream_config,
-        'audio_config': audio_config
-    }
+    components = Components(
+        audio_capture=audio_capture,
+        fft_processor=fft_processor,
+        data_streamer=data_streamer,
+        stream_config=stream_config,
+        audio_config=audio_config
+    )
 
 # ============================================================================
 # 数据模型
 # ============================================================================
 
-class FPSConfig(BaseModel):
+class FPSConfig(msgspec.Struct):
     """FPS配置"""
-    target_fps: int = Field(ge=1, le=120, description="目标帧率 (1-120)")
+    target_fps: Annotated[int, msgspec.Meta(ge=1, le=120, description="目标帧率 (1-120)")]
 
-class ThresholdConfig(BaseModel):
+class ThresholdConfig(msgspec.Struct):
     """阈值配置"""
-    threshold_db: float = Field(ge=-200, le=0, description="dB阈值 (-200 到 0)")
-    magnitude_threshold_db: float = Field(ge=-200, le=0, description="幅度阈值 (-200 到 0)")
-    similarity_threshold: float = Field(ge=0.0, le=1.0, description="相似度阈值 (0.0 到 1.0)")
+    threshold_db: Annotated[float, msgspec.Meta(ge=-200, le=0, description="dB阈值 (-200 到 0)")]
+    magnitude_threshold_db: Annotated[float, msgspec.Meta(ge=-200, le=0, description="幅度阈值 (-200 到 0)")]
+    similarity_threshold: Annotated[float, msgspec.Meta(ge=0.0, le=1.0, description="相似度阈值 (0.0 到 1.0)")]
 
-class CompressionConfig(BaseModel):
+class CompressionConfig(msgspec.Struct):
     """压缩配置"""
-    compression_level: int = Field(ge=1, le=9, description="压缩级别 (1-9)")
+    compression_level: Annotated[int, msgspec.Meta(ge=1, le=9, description="压缩级别 (1-9)")]
 
-class FilterConfig(BaseModel):
+class FilterConfig(msgspec.Struct):
     """过滤配置"""
-    enable_smart_skip: bool = Field(description="启用智能跳帧")
-    enable_adaptive_fps: bool = Field(description="启用自适应FPS")
+    enable_smart_skip: Annotated[bool, msgspec.Meta(description="启用智能跳帧")]
+    enable_adaptive_fps: Annotated[bool, msgspec.Meta(description="启用自适应FPS")]
+
+_MSGSPEC_PATH = re.compile(r"^(.*) - at `\$(.*)`$")
+_MSGSPEC_PATH_PART = re.compile(r"\.([^.\[]+)|\[(\d+)\]")
+_MSGSPEC_MISSING = re.compile(r"^Object missing required field `(.+)`$")
+
+def _msgspec_errors(e: msgspec.MsgspecError) -> list:
+    """将msgspec错误转换为FastAPI的结构化校验错误列表（与validated_body的422格式一致）"""
+    if not isinstance(e, msgspec.ValidationError):
+        return [{"type": "json_invalid", "loc": ("body", 0), "msg": str(e), "input": {}}]
+    
+    msg, path = str(e), ""
+    match = _MSGSPEC_PATH.match(msg)
+    if match:
+        msg, path = match.groups()
+    loc = ["body"]
+    for key, index in _MSGSPEC_PATH_PART.findall(path):
+        loc.append(key if key else int(index))
+    
+    missing = _MSGSPEC_MISSING.match(msg)
+    if missing:
+        loc.append(missing.group(1))
+        return [{"type": "missing", "loc": tuple(loc), "msg": "Field required", "input": None}]
+    return [{"type": "value_error", "loc": tuple(loc), "msg": msg, "input": None}]
+
+def _msgspec_body(struct_type):
+    """创建msgspec请求体解码依赖
+
+    解码器在导入时构建一次，请求时直接从原始字节解码并校验；
+    非严格模式下与pydantic一样接受"45"这类可转换的值
+    """
+    decoder = msgspec.json.Decoder(struct_type, strict=False)
+    
+    async def decode_body(request: Request):
+        try:
+            return decoder.decode(await request.body())
+        except msgspec.MsgspecError as e:
+            raise RequestValidationError(_msgspec_errors(e))
+    
+    return Depends(decode_body)
+
+def _msgspec_openapi(struct_type) -> dict:
+    """生成请求体的OpenAPI描述（用于文档）"""
+    _, schemas = msgspec.json.schema_components((struct_type,))
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": schemas[struct_type.__name__]}}
+        }
+    }
 
 class ConfigResponse(BaseModel):
-    """配置响应"""
+    """配置响应
+
+    响应内容均由本模块代码构造，使用model_construct跳过校验
+    """
     success: bool
     message: str
     current_config: dict
 
+# ============================================================================
+# 配置预设 (只读常量)
+# ============================================================================
+
+_PRESETS = {
+    "low_noise": {
+        "name": "低噪声模式",
+        "description": "适合安静环境，高灵敏度",
+        "threshold_db": -120.0,
+        "magnitude_threshold_db": -90.0,
+        "similarity_threshold": 0.90,
+        "target_fps": 30,
+        "compression_level": 9
+    },
+    "balanced": {
+        "name": "平衡模式",
+        "description": "默认推荐设置",
+        "threshold_db": -100.0,
+        "magnitude_threshold_db": -80.0,
+        "similarity_threshold": 0.95,
+        "target_fps": 30,
+        "compression_level": 6
+    },
+    "high_signal": {
+        "name": "强信号模式", 
+        "description": "只显示强信号，适合嘈杂环境",
+        "threshold_db": -80.0,
+        "magnitude_threshold_db": -60.0,
+        "similarity_threshold": 0.98,
+        "target_fps": 60,
+        "compression_level": 3
+    },
+    "performance": {
+        "name": "性能优先",
+        "description": "最低CPU占用，适合长时间监控",
+        "threshold_db": -90.0,
+        "magnitude_threshold_db": -70.0,
+        "similarity_threshold": 0.99,
+        "target_fps": 15,
+        "compression_level": 9
+    }
+}
+
+PRESETS: Final[Mapping[str, dict]] = MappingProxyType(_PRESETS)
+
 # ============================================================================
 # 热更新API (不需要重启)
 # ============================================================================
 
-@router.post("/fps")
-async def update_fps(config: FPSConfig):
+@router.post("/fps", openapi_extra=_msgspec_openapi(FPSConfig))
+async def update_fps(config: FPSConfig = _msgspec_body(FPSConfig)):
     """动态更新目标FPS"""
+    if components is None:
+        raise HTTPException(status_code=503, detail="组件未初始化")
+    
+    # 值未变化时直接返回，避免无谓地重配置data_streamer
+    if config.target_fps == components.stream_config.target_fps:
+        return ConfigResponse.model_construct(
+            success=True,
+            message="FPS未变化",
+            current_config={"target_fps": config.target_fps}
+        )
+    
     try:
-        if 'stream_config' not in components:
-            raise HTTPException(status_code=503, detail="组件未初始化")
-        
-        old_fps = components['stream_config'].target_fps
-        components['stream_config'].target_fps = config.target_fps
+        old_fps = components.stream_config.target_fps
+        components.stream_config.target_fps = config.target_fps
         
         # 同时更新data_streamer的内部配置（如果支持）
-        if 'data_streamer' in components:
-            if hasattr(components['data_streamer'], 'update_config'):
-                components['data_streamer'].update_config(components['stream_config'])
+        if hasattr(components.data_streamer, 'update_config'):
+            components.data_streamer.update_config(components.stream_config)
         
-        logger.info(f"FPS已更新: {old_fps} -> {config.target_fps}")
+        _current_config_cache.clear()
+        logger.info("FPS已更新: %s -> %s", old_fps, config.target_fps)
         
-        return ConfigResponse(
+        return ConfigResponse.model_construct(
             success=True,
             message=f"FPS已更新为 {config.target_fps}",
             current_config={"target_fps": config.target_fps}
         )
         
     except Exception as e:
-        logger.error(f"更新FPS失败: {e}")
+        logger.error("更新FPS失败: %s", e)
         raise HTTPException(status_code=500, detail=f"更新FPS失败: {str(e)}")
 
-@router.post("/threshold")  
-async def update_threshold(config: ThresholdConfig):
+@router.post("/threshold", openapi_extra=_msgspec_openapi(ThresholdConfig))
+async def update_threshold(config: ThresholdConfig = _msgspec_body(ThresholdConfig)):
     """动态更新各种阈值"""
+    if components is None:
+        raise HTTPException(status_code=503, detail="组件未初始化")
+    
+    if (config.threshold_db, config.magnitude_threshold_db, config.similarity_threshold) == (
+            components.fft_processor.threshold_db,
+            components.stream_config.magnitude_threshold_db,
+            components.stream_config.similarity_threshold):
+        return ConfigResponse.model_construct(
+            success=True,
+            message="阈值未变化",
+            current_config=msgspec.to_builtins(config)
+        )
+    
     try:
-        if 'fft_processor' not in components or 'stream_config' not in components:
-            raise HTTPException(status_code=503, detail="组件未初始化")
-            
-        old_config = {
-            'threshold_db': components['fft_processor'].threshold_db,
-            'magnitude_threshold_db': components['stream_config'].magnitude_threshold_db,
-            'similarity_threshold': components['stream_config'].similarity_threshold
-        }
+        old_threshold_db = components.fft_processor.threshold_db
+        old_magnitude_threshold_db = components.stream_config.magnitude_threshold_db
+        old_similarity_threshold = components.stream_config.similarity_threshold
         
         # 更新FFT处理器阈值
-        components['fft_processor'].threshold_db = config.threshold_db
+        components.fft_processor.threshold_db = config.threshold_db
         
         # 更新流配置阈值
-        components['stream_config'].magnitude_threshold_db = config.magnitude_threshold_db
-        components['stream_config'].similarity_threshold = config.similarity_threshold
+        components.stream_config.magnitude_threshold_db = config.magnitude_threshold_db
+        components.stream_config.similarity_threshold = config.similarity_threshold
         
         # 同步到data_streamer（如果支持）
-        if 'data_streamer' in components:
-            if hasattr(components['data_streamer'], 'update_config'):
-                components['data_streamer'].update_config(components['stream_config'])
+        if hasattr(components.data_streamer, 'update_config'):
+            components.data_streamer.update_config(components.stream_config)
         
-        logger.info(f"阈值已更新: {old_config} -> {config.dict()}")
+        _current_config_cache.clear()
+        logger.info(
+            "阈值已更新: threshold_db %s -> %s, magnitude_threshold_db %s -> %s, similarity_threshold %s -> %s",
+            old_threshold_db, config.threshold_db,
+            old_magnitude_threshold_db, config.magnitude_threshold_db,
+            old_similarity_threshold, config.similarity_threshold
+        )
         
-        return ConfigResponse(
+        return ConfigResponse.model_construct(
             success=True,
             message="所有阈值已更新",
-            current_config=config.dict()
+            current_config=msgspec.to_builtins(config)
         )
         
     except Exception as e:
-        logger.error(f"更新阈值失败: {e}")
+        logger.error("更新阈值失败: %s", e)
         raise HTTPException(status_code=500, detail=f"更新阈值失败: {str(e)}")
 
-@router.post("/compression")
-async def update_compression(config: CompressionConfig):
+@router.post("/compression", openapi_extra=_msgspec_openapi(CompressionConfig))
+async def update_compression(config: CompressionConfig = _msgspec_body(CompressionConfig)):
     """动态更新压缩配置"""
+    if components is None:
+        raise HTTPException(status_code=503, detail="组件未初始化")
+    
+    if config.compression_level == components.fft_processor.compression_level == \
+            components.stream_config.compression_level:
+        return ConfigResponse.model_construct(
+            success=True,
+            message="压缩级别未变化",
+            current_config={"compression_level": config.compression_level}
+        )
+    
     try:
-        if 'fft_processor' not in components or 'stream_config' not in components:
-            raise HTTPException(status_code=503, detail="组件未初始化")
-            
-        old_level = components['fft_processor'].compression_level
-        components['fft_processor'].compression_level = config.compression_level
-        components['stream_config'].compression_level = config.compression_level
+        old_level = components.fft_processor.compression_level
+        components.fft_processor.compression_level = config.compression_level
+        components.stream_config.compression_level = config.compression_level
         
-        logger.info(f"压缩级别已更新: {old_level} -> {config.compression_level}")
+        _current_config_cache.clear()
+        logger.info("压缩级别已更新: %s -> %s", old_level, config.compression_level)
         
-        return ConfigResponse(
+        return ConfigResponse.model_construct(
             success=True,
             message=f"压缩级别已更新为 {config.compression_level}",
             current_config={"compression_level": config.compression_level}
         )
         
     except Exception as e:
-        logger.error(f"更新压缩配置失败: {e}")
+        logger.error("更新压缩配置失败: %s", e)
         raise HTTPException(status_code=500, detail=f"更新压缩配置失败: {str(e)}")
 
-@router.post("/filter")
-async def update_filter(config: FilterConfig):
+@router.post("/filter", openapi_extra=_msgspec_openapi(FilterConfig))
+async def update_filter(config: FilterConfig = _msgspec_body(FilterConfig)):
     """动态更新过滤配置"""
+    if components is None:
+        raise HTTPException(status_code=503, detail="组件未初始化")
+    
+    if (config.enable_smart_skip, config.enable_adaptive_fps) == (
+            components.stream_config.enable_smart_skip,
+            components.stream_config.enable_adaptive_fps):
+        return ConfigResponse.model_construct(
+            success=True,
+            message="过滤配置未变化",
+            current_config=msgspec.to_builtins(config)
+        )
+    
     try:
-        if 'stream_config' not in components:
-            raise HTTPException(status_code=503, detail="组件未初始化")
-            
-        old_config = {
-            'enable_smart_skip': components['stream_config'].enable_smart_skip,
-            'enable_adaptive_fps': components['stream_config'].enable_adaptive_fps
-        }
+        old_smart_skip = components.stream_config.enable_smart_skip
+        old_adaptive_fps = components.stream_config.enable_adaptive_fps
         
-        components['stream_config'].enable_smart_skip = config.enable_smart_skip
-        components['stream_config'].enable_adaptive_fps = config.enable_adaptive_fps
+        components.stream_config.enable_smart_skip = config.enable_smart_skip
+        components.stream_config.enable_adaptive_fps = config.enable_adaptive_fps
         
         # 同步到data_streamer（如果支持）
-        if 'data_streamer' in components:
-            if hasattr(components['data_streamer'], 'update_config'):
-                components['data_streamer'].update_config(components['stream_config'])
+        if hasattr(components.data_streamer, 'update_config'):
+            components.data_streamer.update_config(components.stream_config)
         
-        logger.info(f"过滤配置已更新: {old_config} -> {config.dict()}")
+        _current_config_cache.clear()
+        logger.info(
+            "过滤配置已更新: enable_smart_skip %s -> %s, enable_adaptive_fps %s -> %s",
+            old_smart_skip, config.enable_smart_skip,
+            old_adaptive_fps, config.enable_adaptive_fps
+        )
         
-        return ConfigResponse(
+        return ConfigResponse.model_construct(
             success=True,
             message="过滤配置已更新",
-            current_config=config.dict()
+            current_config=msgspec.to_builtins(config)
         )
         
     except Exception as e:
-        logger.error(f"更新过滤配置失败: {e}")
+        logger.error("更新过滤配置失败: %s", e)
         raise HTTPException(status_code=500, detail=f"更新过滤配置失败: {str(e)}")
 
 # ============================================================================
 # 配置查询API
 # ============================================================================
 
-@router.get("/current")
+@router.get("/current", responses={200: {"model": ConfigResponse}})
 async def get_current_config():
     """获取当前所有配置"""
+    if components is None:
+        raise HTTPException(status_code=503, detail="组件未初始化")
+    
     try:
-        if not components:
-            raise HTTPException(status_code=503, detail="组件未初始化")
-            
-        config = {
-            "stream_config": {
-                "target_fps": components['stream_config'].target_fps,
-                "compression_level": components['stream_config'].compression_level,
-                "enable_adaptive_fps": components['stream_config'].enable_adaptive_fps,
-                "enable_smart_skip": components['stream_config'].enable_smart_skip,
-                "magnitude_threshold_db": components['stream_config'].magnitude_threshold_db,
-                "similarity_threshold": components['stream_config'].similarity_threshold,
-                "min_fps": components['stream_config'].min_fps,
-                "max_fps": components['stream_config'].max_fps
-            },
-            "audio_config": {
-                "sample_rate": components['audio_config'].sample_rate,
-                "fft_size": components['audio_config'].fft_size,
-                "overlap": components['audio_config'].overlap,
-                "window_type": components['audio_config'].window_type,
-                "threshold_db": components['audio_config'].threshold_db,
-                "channels": components['audio_config'].channels,
-                "blocksize": components['audio_config'].blocksize
-            },
-            "fft_processor": {
-                "threshold_db": components['fft_processor'].threshold_db,
-                "compression_level": components['fft_processor'].compression_level,
-                "frames_processed": components['fft_processor'].frames_processed
+        config = _current_config_cache.get("current")
+        if config is None:
+            config = {
+                "stream_config": {
+                    "target_fps": components.stream_config.target_fps,
+                    "compression_level": components.stream_config.compression_level,
+                    "enable_adaptive_fps": components.stream_config.enable_adaptive_fps,
+                    "enable_smart_skip": components.stream_config.enable_smart_skip,
+                    "magnitude_threshold_db": components.stream_config.magnitude_threshold_db,
+                    "similarity_threshold": components.stream_config.similarity_threshold,
+                    "min_fps": components.stream_config.min_fps,
+                    "max_fps": components.stream_config.max_fps
+                },
+                "audio_config": {
+                    "sample_rate": components.audio_config.sample_rate,
+                    "fft_size": components.audio_config.fft_size,
+                    "overlap": components.audio_config.overlap,
+                    "window_type": components.audio_config.window_type,
+                    "threshold_db": components.audio_config.threshold_db,
+                    "channels": components.audio_config.channels,
+                    "blocksize": components.audio_config.blocksize
+                },
+                "fft_processor": {
+                    "threshold_db": components.fft_processor.threshold_db,
+                    "compression_level": components.fft_processor.compression_level
+                }
             }
-        }
+            _current_config_cache["current"] = config
         
-        return ConfigResponse(
-            success=True,
-            message="当前配置获取成功",
-            current_config=config
-        )
+        # 实时计数不进缓存，每次读取最新值
+        return NPResponse({
+            "success": True,
+            "message": "当前配置获取成功",
+            "current_config": {
+                **config,
+                "fft_processor": {
+                    **config["fft_processor"],
+                    "frames_processed": components.fft_processor.frames_processed
+                }
+            }
+        })
         
     except Exception as e:
-        logger.error(f"获取配置失败: {e}")
+        logger.error("获取配置失败: %s", e)
         raise HTTPException(status_code=500, detail=f"获取配置失败: {str(e)}")
 
 @router.get("/presets")
 async def get_config_presets():
     """获取配置预设"""
-    presets = {
-        "low_noise": {
-            "name": "低噪声模式",
-            "description": "适合安静环境，高灵敏度",
-            "threshold_db": -120.0,
-            "magnitude_threshold_db": -90.0,
-            "similarity_threshold": 0.90,
-            "target_fps": 30,
-            "compression_level": 9
-        },
-        "balanced": {
-            "name": "平衡模式",
-            "description": "默认推荐设置",
-            "threshold_db": -100.0,
-            "magnitude_threshold_db": -80.0,
-            "similarity_threshold": 0.95,
-            "target_fps": 30,
-            "compression_level": 6
-        },
-        "high_signal": {
-            "name": "强信号模式", 
-            "description": "只显示强信号，适合嘈杂环境",
-            "threshold_db": -80.0,
-            "magnitude_threshold_db": -60.0,
-            "similarity_threshold": 0.98,
-            "target_fps": 60,
-            "compression_level": 3
-        },
-        "performance": {
-            "name": "性能优先",
-            "description": "最低CPU占用，适合长时间监控",
-            "threshold_db": -90.0,
-            "magnitude_threshold_db": -70.0,
-            "similarity_threshold": 0.99,
-            "target_fps": 15,
-            "compression_level": 9
-        }
-    }
-    
-    return {"presets": presets}
+    return NPResponse({"presets": dict(PRESETS)})
 
 @router.post("/apply_preset/{preset_name}")
 async def apply_preset(preset_name: str):
     """应用配置预设"""
-    presets = await get_config_presets()
-    
-    if preset_name not in presets["presets"]:
+    preset = PRESETS.get(preset_name)
+    if preset is None:
         raise HTTPException(status_code=404, detail="预设不存在")
-        
-    preset = presets["presets"][preset_name]
+    
+    if components is None:
+        raise HTTPException(status_code=503, detail="组件未初始化")
     
     try:
-        # 应用FPS配置
-        await update_fps(FPSConfig(target_fps=preset["target_fps"]))
+        # 预设为本模块内的常量，直接写入状态，无需逐个经过更新端点
+        stream_config = components.stream_config
+        stream_config.target_fps = preset["target_fps"]
+        stream_config.magnitude_threshold_db = preset["magnitude_threshold_db"]
+        stream_config.similarity_threshold = preset["similarity_threshold"]
+        stream_config.compression_level = preset["compression_level"]
         
-        # 应用阈值配置
-        await update_threshold(ThresholdConfig(
-            threshold_db=preset["threshold_db"],
-            magnitude_threshold_db=preset["magnitude_threshold_db"], 
-            similarity_threshold=preset["similarity_threshold"]
-        ))
+        components.fft_processor.threshold_db = preset["threshold_db"]
+        components.fft_processor.compression_level = preset["compression_level"]
         
-        # 应用压缩配置
-        await update_compression(CompressionConfig(
-            compression_level=preset["compression_level"]
-        ))
+        # 统一同步一次到data_streamer
+        if hasattr(components.data_streamer, 'update_config'):
+            components.data_streamer.update_config(stream_config)
         
-        logger.info(f"已应用预设: {preset_name}")
+        _current_config_cache.clear()
+        logger.info("已应用预设: %s", preset_name)
         
-        return ConfigResponse(
+        return ConfigResponse.model_construct(
             success=True,
             message=f"已应用预设: {preset['name']}",
             current_config=preset
         )
         
     except Exception as e:
-        logger.error(f"应用预设失败: {e}")
+        logger.error("应用预设失败: %s", e)
         raise HTTPException(status_code=500, detail=f"应用预设失败: {str(e)}")
\ No newline at end of file
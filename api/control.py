@@ -4,10 +4,17 @@
 提供配置管理和系统控制功能
 """
 from fastapi import APIRouter, HTTPException
-from typing import Dict, Any
+from .responses import NPResponse, now_ms
+from typing import Dict, Any, Optional
+import asyncio
 import logging
+import numpy as np
+from time import time as _time
+from cachetools import TTLCache
 from models import StreamConfig, AudioConfig, SystemStatus, ControlResponse
 from core import DeviceIDManager
+from .cache import TTL_NORMAL
+from .config import invalidate_current_config
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api", tags=["control"])
@@ -22,6 +29,73 @@ audio_config = None
 # 设备ID管理器
 device_id_manager = DeviceIDManager()
 
+# 压缩测试数据 (固定种子，只读，保证基准结果可复现)
+_COMPRESSION_TEST_DATA = np.random.default_rng(seed=0).random(4097).astype(np.float32) * 100 - 50  # 模拟FFT数据
+_COMPRESSION_TEST_DATA.setflags(write=False)
+
+# 设备状态常量
+STATUS_UNKNOWN = "unknown"
+STATUS_AVAILABLE = "available"
+STATUS_UNAVAILABLE = "unavailable"
+STATUS_ACTIVE = "active"
+STATUS_INACTIVE = "inactive"
+STATUS_DISCONNECTED = "disconnected"
+STATUS_TIMEOUT = "timeout"
+
+# 设备探测结果缓存（避免每次轮询都查询PortAudio；采集状态与时间戳每次实时计算）
+_devices_cache = TTLCache(maxsize=1, ttl=TTL_NORMAL)
+
+def _check_input_devices(sd, devices) -> Dict[int, Optional[str]]:
+    """检测所有输入设备的可用性（阻塞的PortAudio调用，需在线程池中执行）
+    
+    Returns:
+        {系统索引: 错误信息，可用时为None}
+    """
+    results = {}
+    for i, device in enumerate(devices):
+        if device['max_input_channels'] > 0:
+            try:
+                sd.check_input_settings(device=i, channels=1, samplerate=device['default_samplerate'])
+                results[i] = None
+            except Exception as e:
+                results[i] = str(e)
+    return results
+
+def _query_and_snapshot(sd):
+    """查询设备列表并一次性分配稳定ID（阻塞：PortAudio查询、加锁计算签名、可能写映射文件，需在线程池中执行）"""
+    devices = sd.query_devices()
+    id_for_index, mapping_stats = device_id_manager.snapshot(devices)
+    return devices, id_for_index, mapping_stats
+
+def _query_and_find(sd, stable_id: str):
+    """查询设备列表并按稳定ID查找设备（阻塞：PortAudio查询、计算签名，需在线程池中执行）
+    
+    Returns:
+        (device, system_index) 或 None
+    """
+    return device_id_manager.get_device_by_stable_id(stable_id, sd.query_devices())
+
+def _cleanup_mapping(sd):
+    """查询设备列表并清理丢失设备的映射（阻塞，需在线程池中执行）
+    
+    Returns:
+        (清理前统计, 清理后统计)
+    """
+    devices = sd.query_devices()
+    before_stats = device_id_manager.get_mapping_stats()
+    device_id_manager.cleanup_missing_devices(devices)
+    return before_stats, device_id_manager.get_mapping_stats()
+
+def _capture_device_status(audio_stats: dict) -> str:
+    """根据采集统计判断当前采集设备的状态"""
+    if not audio_stats.get("is_running"):
+        return STATUS_INACTIVE
+    if audio_stats.get("device_disconnected"):
+        return STATUS_DISCONNECTED
+    if audio_stats.get("callback_health") == "timeout":
+        return STATUS_TIMEOUT
+    return STATUS_ACTIVE
+
 def set_components(capture, processor, streamer, s_config, a_config):
     """设置全局组件引用"""
     global audio_capture, fft_processor, data_streamer, stream_config, audio_config
@@ -31,7 +105,7 @@ def set_components(capture, processor, streamer, s_config, a_config):
     stream_config = s_config
     audio_config = a_config
 
-@router.get("/status", response_model=SystemStatus)
+@router.get("/status", responses={200: {"model": SystemStatus}})
 async def get_system_status():
     """获取系统状态"""
     if not all([audio_capture, fft_processor, data_streamer]):
@@ -42,18 +116,19 @@ async def get_system_status():
     fft_stats = fft_processor.get_stats()
     stream_stats = data_streamer.get_stats()
     
-    return SystemStatus(
-        is_running=audio_stats["is_running"],
-        current_fps=stream_stats.get("current_fps", 0.0),
-        connected_clients=stream_stats.get("connected_clients", 0),
-        total_frames_sent=stream_stats.get("total_frames_sent", 0),
-        total_bytes_sent=stream_stats.get("total_bytes_sent", 0),
-        uptime_seconds=stream_stats.get("uptime_seconds", 0.0),
-        audio_device_name=audio_stats.get("device_name"),
-        last_error=audio_stats.get("last_error"),
-        device_disconnected=audio_stats.get("device_disconnected", False),
-        callback_health=audio_stats.get("callback_health", "unknown")
-    )
+    # 数据来自进程内组件，直接返回字典，跳过响应模型校验
+    return NPResponse({
+        "is_running": audio_stats["is_running"],
+        "current_fps": stream_stats.get("current_fps", 0.0),
+        "connected_clients": stream_stats.get("connected_clients", 0),
+        "total_frames_sent": stream_stats.get("total_frames_sent", 0),
+        "total_bytes_sent": stream_stats.get("total_bytes_sent", 0),
+        "uptime_seconds": stream_stats.get("uptime_seconds", 0.0),
+        "audio_device_name": audio_stats.get("device_name"),
+        "last_error": audio_stats.get("last_error"),
+        "device_disconnected": audio_stats.get("device_disconnected", False),
+        "callback_health": audio_stats.get("callback_health", "unknown")
+    })
 
 @router.post("/start", response_model=ControlResponse)
 async def start_system():
@@ -63,6 +138,7 @@ async def start_system():
     
     try:
         success = audio_capture.start()
+        _devices_cache.clear()
         if success:
             logger.info("系统启动成功")
             return ControlResponse.success("系统已启动")
@@ -80,18 +156,19 @@ async def stop_system():
     
     try:
         audio_capture.stop()
+        _devices_cache.clear()
         logger.info("系统已停止")
         return ControlResponse.success("系统已停止")
     except Exception as e:
         logger.error(f"停止系统失败: {e}")
         return ControlResponse.error(f"停止失败: {str(e)}")
 
-@router.get("/config/stream", response_model=StreamConfig)
-async def get_stream_config():
+@router.get("/config/stream", responses={200: {"model": StreamConfig}})
+def get_stream_config():
     """获取流配置"""
     if not stream_config:
         raise HTTPException(status_code=503, detail="流配置未初始化")
-    return stream_config
+    return NPResponse(stream_config.model_dump())
 
 @router.post("/config/stream", response_model=ControlResponse)
 async def update_stream_config(config: StreamConfig):
@@ -111,12 +188,12 @@ async def update_stream_config(config: StreamConfig):
         logger.error(f"更新流配置失败: {e}")
         return ControlResponse.error(f"配置更新失败: {str(e)}")
 
-@router.get("/config/audio", response_model=AudioConfig)
-async def get_audio_config():
+@router.get("/config/audio", responses={200: {"model": AudioConfig}})
+def get_audio_config():
     """获取音频配置"""
     if not audio_config:
         raise HTTPException(status_code=503, detail="音频配置未初始化")
-    return audio_config
+    return NPResponse(audio_config.model_dump())
 
 # FPS端点已移动到 /api/config/fps (在api/config.py中)
 # 保留旧的端点作为兼容性支持，但使用query参数
@@ -134,6 +211,7 @@ async def set_fps_legacy(fps: int):
         global stream_config
         stream_config.target_fps = fps
         data_streamer.update_config(stream_config)
+        invalidate_current_config()
         
         logger.info(f"FPS已设置为: {fps}")
         return ControlResponse.success(f"FPS已设置为: {fps}")
@@ -147,84 +225,91 @@ async def get_detailed_stats():
     if not all([audio_capture, fft_processor, data_streamer]):
         raise HTTPException(status_code=503, detail="系统组件未初始化")
     
-    return {
-        "timestamp": __import__('time').time() * 1000,
+    return NPResponse({
+        "timestamp": now_ms(),
         "audio": audio_capture.get_stats(),
         "fft": fft_processor.get_stats(), 
         "stream": data_streamer.get_stats(),
         "config": {
-            "stream": stream_config.dict() if stream_config else None,
-            "audio": audio_config.dict() if audio_config else None
+            "stream": stream_config.model_dump() if stream_config else None,
+            "audio": audio_config.model_dump() if audio_config else None
         }
-    }
+    })
+
+async def _probe_audio_devices(sd):
+    """查询设备列表、分配稳定ID并检测可用性，结果在TTL_NORMAL内复用
+    
+    Returns:
+        (devices, id_for_index, mapping_stats, check_errors, default_input_index)
+    """
+    probe = _devices_cache.get("devices")
+    if probe is not None:
+        return probe
+    
+    # 一次性清理丢失映射并分配稳定ID（与设备查询在同一次线程切换中完成）
+    devices, id_for_index, mapping_stats = await asyncio.to_thread(_query_and_snapshot, sd)
+    
+    # 在线程池中检测设备可用性，避免阻塞事件循环
+    check_errors = await asyncio.to_thread(_check_input_devices, sd, devices)
+    
+    # 默认输入设备索引只解析一次
+    default_input_index = sd.default.device[0] if hasattr(sd.default, 'device') else -1
+    
+    probe = (devices, id_for_index, mapping_stats, check_errors, default_input_index)
+    _devices_cache["devices"] = probe
+    return probe
 
 @router.get("/devices")
 async def list_audio_devices():
     """列出可用的音频设备及其状态（使用稳定ID）"""
     try:
         import sounddevice as sd
-        devices = sd.query_devices()
+        devices, id_for_index, mapping_stats, check_errors, default_input_index = \
+            await _probe_audio_devices(sd)
         
-        # 清理不存在的设备映射
-        device_id_manager.cleanup_missing_devices(devices)
-        
-        # 获取当前使用的设备信息
+        # 获取当前使用的设备信息（实时状态，不缓存）
         current_device_name = None
-        current_device_status = "unknown"
+        current_device_status = STATUS_UNKNOWN
         if audio_capture:
             audio_stats = audio_capture.get_stats()
             current_device_name = audio_stats.get("device_name")
-            if audio_stats.get("is_running"):
-                if audio_stats.get("device_disconnected"):
-                    current_device_status = "disconnected"
-                elif audio_stats.get("callback_health") == "timeout":
-                    current_device_status = "timeout"
-                else:
-                    current_device_status = "active"
-            else:
-                current_device_status = "inactive"
+            current_device_status = _capture_device_status(audio_stats)
+        current_device_name_cf = (current_device_name or "").casefold()
         
         input_devices = []
-        for i, device in enumerate(devices):
-            if device['max_input_channels'] > 0:
-                # 生成或获取稳定ID
-                stable_id, system_index = device_id_manager.get_or_create_device_id(device, i)
-                
-                # 确定设备状态
-                device_status = "available"
-                is_current_device = False
-                
-                if current_device_name and device['name'] in current_device_name:
-                    is_current_device = True
-                    device_status = current_device_status
-                
-                # 尝试检测设备可用性
-                try:
-                    # 简单的设备可用性检查
-                    sd.check_input_settings(device=i, channels=1, samplerate=device['default_samplerate'])
-                except Exception:
-                    if not is_current_device:
-                        device_status = "unavailable"
-                
-                input_devices.append({
-                    "id": stable_id,  # 使用稳定ID
-                    "system_index": i,  # 保留系统索引作为参考
-                    "name": device['name'],
-                    "max_channels": device['max_input_channels'],
-                    "default_samplerate": device['default_samplerate'],
-                    "is_default": i == sd.default.device[0] if hasattr(sd.default, 'device') else False,
-                    "is_current": is_current_device,
-                    "status": device_status
-                })
+        for i, stable_id in id_for_index.items():
+            device = devices[i]
+            
+            # 确定设备状态
+            is_current_device = bool(current_device_name_cf) and \
+                device['name'].casefold() in current_device_name_cf
+            
+            if is_current_device:
+                device_status = current_device_status
+            elif check_errors.get(i) is not None:
+                device_status = STATUS_UNAVAILABLE
+            else:
+                device_status = STATUS_AVAILABLE
+            
+            input_devices.append({
+                "id": stable_id,  # 使用稳定ID
+                "system_index": i,  # 保留系统索引作为参考
+                "name": device['name'],
+                "max_channels": device['max_input_channels'],
+                "default_samplerate": device['default_samplerate'],
+                "is_default": i == default_input_index,
+                "is_current": is_current_device,
+                "status": device_status
+            })
         
-        return {
+        return NPResponse({
             "devices": input_devices,
             "current_device": current_device_name,
             "system_status": current_device_status,
             "total_devices": len(input_devices),
-            "device_mapping_stats": device_id_manager.get_mapping_stats(),
-            "timestamp": __import__('time').time() * 1000
-        }
+            "device_mapping_stats": mapping_stats,
+            "timestamp": now_ms()
+        })
     except Exception as e:
         logger.error(f"获取音频设备列表失败: {e}")
         raise HTTPException(status_code=500, detail=f"获取设备列表失败: {str(e)}")
@@ -234,10 +319,12 @@ async def get_device_status(device_id: str):
     """获取指定设备的详细状态（支持稳定ID）"""
     try:
         import sounddevice as sd
-        devices = sd.query_devices()
         
-        # 通过稳定ID找到设备
-        device_info_tuple = device_id_manager.get_device_by_stable_id(device_id, devices)
+        # 当前采集设备统计只取一次
+        audio_stats = audio_capture.get_stats() if audio_capture else None
+        
+        # 通过稳定ID找到设备（与设备查询在同一次线程切换中完成）
+        device_info_tuple = await asyncio.to_thread(_query_and_find, sd, device_id)
         if not device_info_tuple:
             raise HTTPException(status_code=404, detail=f"设备ID '{device_id}' 不存在或设备已断开")
         
@@ -248,45 +335,39 @@ async def get_device_status(device_id: str):
             raise HTTPException(status_code=400, detail="该设备不支持音频输入")
         
         # 获取设备基本信息
+        default_input_index = sd.default.device[0] if hasattr(sd.default, 'device') else -1
         device_info = {
             "id": device_id,  # 稳定ID
             "system_index": system_index,  # 系统索引
             "name": device['name'],
             "max_channels": device['max_input_channels'],
             "default_samplerate": device['default_samplerate'],
-            "is_default": system_index == sd.default.device[0] if hasattr(sd.default, 'device') else False
+            "is_default": system_index == default_input_index
         }
         
         # 检查设备状态
-        device_status = "unknown"
+        device_status = STATUS_UNKNOWN
         is_current_device = False
         current_device_stats = {}
         
-        if audio_capture:
-            audio_stats = audio_capture.get_stats()
-            current_device_name = audio_stats.get("device_name", "")
+        if audio_stats:
+            current_device_name_cf = (audio_stats.get("device_name") or "").casefold()
             
-            if device['name'] in current_device_name:
+            if device['name'].casefold() in current_device_name_cf:
                 is_current_device = True
                 current_device_stats = audio_stats
-                
-                if audio_stats.get("is_running"):
-                    if audio_stats.get("device_disconnected"):
-                        device_status = "disconnected"
-                    elif audio_stats.get("callback_health") == "timeout":
-                        device_status = "timeout"
-                    else:
-                        device_status = "active"
-                else:
-                    device_status = "inactive"
+                device_status = _capture_device_status(audio_stats)
         
         # 如果不是当前设备，尝试检测可用性
         if not is_current_device:
             try:
-                sd.check_input_settings(device=system_index, channels=1, samplerate=device['default_samplerate'])
-                device_status = "available"
+                await asyncio.to_thread(
+                    sd.check_input_settings,
+                    device=system_index, channels=1, samplerate=device['default_samplerate']
+                )
+                device_status = STATUS_AVAILABLE
             except Exception as e:
-                device_status = "unavailable"
+                device_status = STATUS_UNAVAILABLE
                 device_info["error"] = str(e)
         
         # 组装响应
@@ -294,7 +375,7 @@ async def get_device_status(device_id: str):
             "device": device_info,
             "status": device_status,
             "is_current": is_current_device,
-            "timestamp": __import__('time').time() * 1000
+            "timestamp": now_ms()
         }
         
         # 如果是当前设备，添加详细统计信息
@@ -312,7 +393,7 @@ async def get_device_status(device_id: str):
                 "last_error": current_device_stats.get("last_error")
             }
         
-        return response
+        return NPResponse(response)
         
     except HTTPException:
         raise
@@ -326,7 +407,7 @@ async def get_device_mapping_info():
     try:
         return {
             "mapping_info": device_id_manager.export_mapping(),
-            "timestamp": __import__('time').time() * 1000
+            "timestamp": now_ms()
         }
     except Exception as e:
         logger.error(f"获取设备映射信息失败: {e}")
@@ -337,23 +418,17 @@ async def cleanup_device_mapping():
     """清理设备映射（移除不存在的设备）"""
     try:
         import sounddevice as sd
-        devices = sd.query_devices()
-        
-        # 获取清理前的统计
-        before_stats = device_id_manager.get_mapping_stats()
         
-        # 执行清理
-        device_id_manager.cleanup_missing_devices(devices)
-        
-        # 获取清理后的统计
-        after_stats = device_id_manager.get_mapping_stats()
+        # 设备查询和映射清理（会写映射文件）在线程池中执行
+        before_stats, after_stats = await asyncio.to_thread(_cleanup_mapping, sd)
+        _devices_cache.clear()
         
         return {
             "message": "设备映射清理完成",
             "before": before_stats,
             "after": after_stats,
             "removed_count": before_stats["total_mappings"] - after_stats["total_mappings"],
-            "timestamp": __import__('time').time() * 1000
+            "timestamp": now_ms()
         }
     except Exception as e:
         logger.error(f"清理设备映射失败: {e}")
@@ -366,16 +441,13 @@ async def test_compression_performance():
         raise HTTPException(status_code=503, detail="FFT处理器未初始化")
     
     try:
-        import numpy as np
-        import time
-        
-        # 生成测试数据
-        test_data = np.random.random(4097).astype(np.float32) * 100 - 50  # 模拟FFT数据
+        test_data = _COMPRESSION_TEST_DATA
         
         # 测试压缩
-        start_time = time.time()
-        compressed, compressed_size, original_size = fft_processor.compress_fft_data(test_data)
-        compression_time = (time.time() - start_time) * 1000
+        start_time = _time()
+        compressed, compressed_size, original_size, _, _ = fft_processor.compress_fft_data(test_data)
+        end_time = _time()
+        compression_time = (end_time - start_time) * 1000
         
         compression_ratio = compressed_size / original_size
         
@@ -385,7 +457,7 @@ async def test_compression_performance():
             "compression_ratio": compression_ratio,
             "compression_time_ms": compression_time,
             "data_sample": compressed[:100] + "..." if len(compressed) > 100 else compressed,
-            "timestamp": time.time() * 1000
+            "timestamp": now_ms()
         }
     except Exception as e:
         logger.error(f"压缩性能测试失败: {e}")
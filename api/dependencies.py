@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+API依赖项
+从app.state解析共享组件，统一处理未初始化的情况；以及请求体的快速校验
+"""
+from typing import Optional
+from fastapi import Depends, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter, ValidationError
+
+from core import DeviceInstanceManager
+
+def get_optional_device_manager(request: Request) -> Optional[DeviceInstanceManager]:
+    """获取设备管理器，未初始化时返回None"""
+    return getattr(request.app.state, "device_manager", None)
+
+def get_device_manager(request: Request) -> DeviceInstanceManager:
+    """获取设备管理器，未初始化时返回503"""
+    device_manager = getattr(request.app.state, "device_manager", None)
+    if device_manager is None:
+        raise HTTPException(status_code=503, detail="设备管理器未初始化")
+    return device_manager
+
+def validated_body(model):
+    """创建Pydantic请求体校验依赖
+
+    TypeAdapter在导入时构建一次，请求时由pydantic-core直接从原始字节解析校验
+    """
+    adapter = TypeAdapter(model)
+    
+    async def validate_body(request: Request):
+        try:
+            return adapter.validate_json(await request.body())
+        except ValidationError as e:
+            raise RequestValidationError(e.errors(include_url=False))
+    
+    return Depends(validate_body)
+
+def body_openapi(model) -> dict:
+    """生成请求体的OpenAPI描述（用于文档）"""
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": model.model_json_schema()}}
+        }
+    }
@@ -3,37 +3,126 @@
 每设备控制API端点
 提供单设备的启停、配置和状态管理
 """
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from typing import Dict, Any
+import asyncio
 import logging
+from functools import partial
 
+from config_loader import Config
 from models import StreamConfig, AudioConfig, ControlResponse
 from core import DeviceInstanceManager, DeviceConflictError
+from .dependencies import get_device_manager, validated_body, body_openapi
+from .responses import control_success, control_error, etag_response, now_ms
+from .cache import get_available_devices_cached
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/devices", tags=["device-control"])
 
-# 全局组件引用 (将在main.py中设置)
-device_manager: DeviceInstanceManager = None
+# 批量操作API (需在 /{device_id}/... 路由之前注册，否则 batch 会被当作 device_id 匹配)
+async def _start_one(
+    device_manager: DeviceInstanceManager,
+    device_id: str,
+    stream_config: StreamConfig,
+    audio_config: AudioConfig
+) -> Dict[str, Any]:
+    """启动单个设备（不存在实例时用给定的默认配置创建），返回批量结果项"""
+    try:
+        # 检查或创建设备实例（实例内部会复制配置，多个设备可共享同一份默认配置）
+        instance = device_manager.get_device_instance(device_id)
+        if not instance:
+            instance = device_manager.create_device_instance(
+                device_id, stream_config, audio_config
+            )
+        
+        success = await device_manager.start_device(device_id)
+        return {
+            "success": success,
+            "message": "启动成功" if success else f"启动失败: {instance.last_error}"
+        }
+        
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"启动失败: {str(e)}"
+        }
 
-def set_device_manager(manager: DeviceInstanceManager):
-    """设置全局设备管理器"""
-    global device_manager
-    device_manager = manager
+async def _stop_one(device_manager: DeviceInstanceManager, device_id: str) -> Dict[str, Any]:
+    """停止单个设备，返回批量结果项"""
+    try:
+        success = await device_manager.stop_device(device_id)
+        return {
+            "success": success,
+            "message": "停止成功" if success else "停止失败"
+        }
+        
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"停止失败: {str(e)}"
+        }
 
-@router.post("/{device_id}/start", response_model=ControlResponse)
-async def start_device(device_id: str):
-    """启动指定设备"""
-    if not device_manager:
-        raise HTTPException(status_code=503, detail="设备管理器未初始化")
+async def _run_batch(operation, device_manager: DeviceInstanceManager, device_ids: list[str]) -> Dict[str, Any]:
+    """并发对多个设备执行操作，单个设备的异常不影响其他设备"""
+    # 去重，避免同一设备被并发操作两次
+    device_ids = list(dict.fromkeys(device_ids))
     
+    outcomes = await asyncio.gather(
+        *(operation(device_manager, device_id) for device_id in device_ids),
+        return_exceptions=True
+    )
+    
+    results = {}
+    for device_id, outcome in zip(device_ids, outcomes):
+        if isinstance(outcome, BaseException):
+            outcome = {"success": False, "message": str(outcome)}
+        results[device_id] = outcome
+    return results
+
+@router.post("/batch/start")
+async def start_multiple_devices(
+    device_ids: list[str],
+    device_manager: DeviceInstanceManager = Depends(get_device_manager)
+):
+    """批量启动多个设备"""
+    # 默认配置只解析一次，由本批次所有新建实例共享
+    start_one = partial(
+        _start_one,
+        stream_config=Config.get_stream_config(),
+        audio_config=Config.get_audio_config()
+    )
+    results = await _run_batch(start_one, device_manager, device_ids)
+    
+    return {
+        "results": results,
+        "timestamp": now_ms()
+    }
+
+@router.post("/batch/stop")
+async def stop_multiple_devices(
+    device_ids: list[str],
+    device_manager: DeviceInstanceManager = Depends(get_device_manager)
+):
+    """批量停止多个设备"""
+    results = await _run_batch(_stop_one, device_manager, device_ids)
+    
+    return {
+        "results": results,
+        "timestamp": now_ms()
+    }
+
+@router.post("/{device_id}/start", responses={200: {"model": ControlResponse}})
+async def start_device(
+    device_id: str,
+    device_manager: DeviceInstanceManager = Depends(get_device_manager)
+):
+    """启动指定设备"""
     try:
         # 检查设备实例是否存在，不存在则创建
         instance = device_manager.get_device_instance(device_id)
         if not instance:
             # 使用默认配置创建设备实例
-            from config_loader import Config
             stream_config = Config.get_stream_config()
             audio_config = Config.get_audio_config()
             
@@ -46,69 +135,71 @@ async def start_device(device_id: str):
         success = await device_manager.start_device(device_id)
         
         if success:
-            return ControlResponse.success(f"设备 {device_id} 启动成功")
+            return control_success(f"设备 {device_id} 启动成功")
         else:
-            return ControlResponse.error(f"设备 {device_id} 启动失败: {instance.last_error}")
+            return control_error(f"设备 {device_id} 启动失败: {instance.last_error}")
             
     except DeviceConflictError as e:
-        return ControlResponse.error(f"设备冲突: {str(e)}")
+        return control_error(f"设备冲突: {str(e)}")
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         logger.error(f"启动设备 {device_id} 失败: {e}")
-        return ControlResponse.error(f"启动失败: {str(e)}")
+        return control_error(f"启动失败: {str(e)}")
 
-@router.post("/{device_id}/stop", response_model=ControlResponse)
-async def stop_device(device_id: str):
+@router.post("/{device_id}/stop", responses={200: {"model": ControlResponse}})
+async def stop_device(
+    device_id: str,
+    device_manager: DeviceInstanceManager = Depends(get_device_manager)
+):
     """停止指定设备"""
-    if not device_manager:
-        raise HTTPException(status_code=503, detail="设备管理器未初始化")
-    
     try:
         success = await device_manager.stop_device(device_id)
         
         if success:
-            return ControlResponse.success(f"设备 {device_id} 停止成功")
+            return control_success(f"设备 {device_id} 停止成功")
         else:
-            return ControlResponse.error(f"设备 {device_id} 停止失败")
+            return control_error(f"设备 {device_id} 停止失败")
             
     except Exception as e:
         logger.error(f"停止设备 {device_id} 失败: {e}")
-        return ControlResponse.error(f"停止失败: {str(e)}")
+        return control_error(f"停止失败: {str(e)}")
 
 @router.get("/{device_id}/status")
-async def get_device_detailed_status(device_id: str):
+async def get_device_detailed_status(
+    device_id: str,
+    request: Request,
+    device_manager: DeviceInstanceManager = Depends(get_device_manager)
+):
     """获取指定设备的详细状态"""
-    if not device_manager:
-        raise HTTPException(status_code=503, detail="设备管理器未初始化")
-    
     try:
         instance = device_manager.get_device_instance(device_id)
         
         if not instance:
             # 设备实例不存在，但设备可能存在于系统中
-            available_devices = device_manager.get_available_devices()
-            device_info = next((d for d in available_devices if d['id'] == device_id), None)
+            # 按TTL刷新枚举结果，再通过管理器的ID索引查找
+            await get_available_devices_cached(device_manager)
+            device_info = device_manager.get_available_device_info(device_id)
             
             if not device_info:
                 raise HTTPException(status_code=404, detail=f"设备 {device_id} 不存在")
             
-            return {
+            return etag_response(request, {
                 "device_id": device_id,
                 "device_name": device_info['name'],
                 "system_index": device_info['system_index'],
                 "state": "not_created",
                 "instance_exists": False,
                 "device_info": device_info,
-                "timestamp": __import__('time').time() * 1000
-            }
+                "timestamp": now_ms()
+            })
         
         # 获取设备实例状态
         status = instance.get_status()
         status["instance_exists"] = True
-        status["timestamp"] = __import__('time').time() * 1000
+        status["timestamp"] = now_ms()
         
-        return status
+        return etag_response(request, status)
         
     except HTTPException:
         raise
@@ -117,11 +208,12 @@ async def get_device_detailed_status(device_id: str):
         raise HTTPException(status_code=500, detail=f"获取状态失败: {str(e)}")
 
 @router.get("/{device_id}/stream")
-async def get_device_stream(device_id: str, request: Request):
+async def get_device_stream(
+    device_id: str,
+    request: Request,
+    device_manager: DeviceInstanceManager = Depends(get_device_manager)
+):
     """获取指定设备的SSE数据流"""
-    if not device_manager:
-        raise HTTPException(status_code=503, detail="设备管理器未初始化")
-    
     try:
         instance = device_manager.get_device_instance(device_id)
         
@@ -134,10 +226,11 @@ async def get_device_stream(device_id: str, request: Request):
                 detail=f"设备未运行，当前状态: {instance.state.value}"
             )
         
-        logger.info(f"新的SSE连接到设备 {device_id}: {request.client.host}:{request.client.port}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("新的SSE连接到设备 %s: %s:%s", device_id, request.client.host, request.client.port)
         
         # 获取设备专属的数据流
-        return await instance.get_stream_generator(request)
+        return instance.get_stream_generator(request)
         
     except HTTPException:
         raise
@@ -145,12 +238,14 @@ async def get_device_stream(device_id: str, request: Request):
         logger.error(f"创建设备流失败 {device_id}: {e}")
         raise HTTPException(status_code=500, detail=f"创建数据流失败: {str(e)}")
 
-@router.post("/{device_id}/config/stream", response_model=ControlResponse)
-async def update_device_stream_config(device_id: str, config: StreamConfig):
+@router.post("/{device_id}/config/stream", responses={200: {"model": ControlResponse}},
+             openapi_extra=body_openapi(StreamConfig))
+async def update_device_stream_config(
+    device_id: str,
+    config: StreamConfig = validated_body(StreamConfig),
+    device_manager: DeviceInstanceManager = Depends(get_device_manager)
+):
     """更新指定设备的流配置"""
-    if not device_manager:
-        raise HTTPException(status_code=503, detail="设备管理器未初始化")
-    
     try:
         instance = device_manager.get_device_instance(device_id)
         
@@ -159,7 +254,7 @@ async def update_device_stream_config(device_id: str, config: StreamConfig):
         
         instance.update_stream_config(config)
         
-        return ControlResponse.success(
+        return control_success(
             f"设备 {device_id} 流配置更新成功，目标FPS: {config.target_fps}"
         )
         
@@ -167,14 +262,14 @@ async def update_device_stream_config(device_id: str, config: StreamConfig):
         raise
     except Exception as e:
         logger.error(f"更新设备流配置失败 {device_id}: {e}")
-        return ControlResponse.error(f"配置更新失败: {str(e)}")
+        return control_error(f"配置更新失败: {str(e)}")
 
 @router.get("/{device_id}/config/stream", response_model=StreamConfig)
-async def get_device_stream_config(device_id: str):
+async def get_device_stream_config(
+    device_id: str,
+    device_manager: DeviceInstanceManager = Depends(get_device_manager)
+):
     """获取指定设备的流配置"""
-    if not device_manager:
-        raise HTTPException(status_code=503, detail="设备管理器未初始化")
-    
     try:
         instance = device_manager.get_device_instance(device_id)
         
@@ -189,12 +284,14 @@ async def get_device_stream_config(device_id: str):
         logger.error(f"获取设备流配置失败 {device_id}: {e}")
         raise HTTPException(status_code=500, detail=f"获取配置失败: {str(e)}")
 
-@router.post("/{device_id}/config/audio", response_model=ControlResponse)
-async def update_device_audio_config(device_id: str, config: AudioConfig):
+@router.post("/{device_id}/config/audio", responses={200: {"model": ControlResponse}},
+             openapi_extra=body_openapi(AudioConfig))
+async def update_device_audio_config(
+    device_id: str,
+    config: AudioConfig = validated_body(AudioConfig),
+    device_manager: DeviceInstanceManager = Depends(get_device_manager)
+):
     """更新指定设备的音频配置（需要重启设备）"""
-    if not device_manager:
-        raise HTTPException(status_code=503, detail="设备管理器未初始化")
-    
     try:
         instance = device_manager.get_device_instance(device_id)
         
@@ -208,20 +305,20 @@ async def update_device_audio_config(device_id: str, config: AudioConfig):
         if restart_needed:
             message += "，需要重启设备才能生效"
         
-        return ControlResponse.success(message)
+        return control_success(message)
         
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"更新设备音频配置失败 {device_id}: {e}")
-        return ControlResponse.error(f"配置更新失败: {str(e)}")
+        return control_error(f"配置更新失败: {str(e)}")
 
 @router.get("/{device_id}/config/audio", response_model=AudioConfig)
-async def get_device_audio_config(device_id: str):
+async def get_device_audio_config(
+    device_id: str,
+    device_manager: DeviceInstanceManager = Depends(get_device_manager)
+):
     """获取指定设备的音频配置"""
-    if not device_manager:
-        raise HTTPException(status_code=503, detail="设备管理器未初始化")
-    
     try:
         instance = device_manager.get_device_instance(device_id)
         
@@ -237,30 +334,30 @@ async def get_device_audio_config(device_id: str):
         raise HTTPException(status_code=500, detail=f"获取配置失败: {str(e)}")
 
 @router.delete("/{device_id}")
-async def remove_device_instance(device_id: str):
+async def remove_device_instance(
+    device_id: str,
+    device_manager: DeviceInstanceManager = Depends(get_device_manager)
+):
     """移除设备实例"""
-    if not device_manager:
-        raise HTTPException(status_code=503, detail="设备管理器未初始化")
-    
     try:
         success = await device_manager.remove_device_instance(device_id)
         
         return {
             "success": success,
             "message": f"设备实例 {device_id} 已移除",
-            "timestamp": __import__('time').time() * 1000
+            "timestamp": now_ms()
         }
         
     except Exception as e:
         logger.error(f"移除设备实例失败 {device_id}: {e}")
         raise HTTPException(status_code=500, detail=f"移除失败: {str(e)}")
 
-@router.post("/{device_id}/restart", response_model=ControlResponse)
-async def restart_device(device_id: str):
+@router.post("/{device_id}/restart", responses={200: {"model": ControlResponse}})
+async def restart_device(
+    device_id: str,
+    device_manager: DeviceInstanceManager = Depends(get_device_manager)
+):
     """重启指定设备"""
-    if not device_manager:
-        raise HTTPException(status_code=503, detail="设备管理器未初始化")
-    
     try:
         instance = device_manager.get_device_instance(device_id)
         
@@ -270,87 +367,23 @@ async def restart_device(device_id: str):
         # 停止设备
         stop_success = await device_manager.stop_device(device_id)
         if not stop_success:
-            return ControlResponse.error(f"重启失败：无法停止设备 {device_id}")
+            return control_error(f"重启失败：无法停止设备 {device_id}")
         
-        # 稍等片刻
-        import asyncio
-        await asyncio.sleep(1)
+        # 等待音频流真正释放后再启动
+        try:
+            await asyncio.wait_for(instance.stopped_event.wait(), timeout=2.0)
+        except asyncio.TimeoutError:
+            logger.warning(f"等待设备 {device_id} 停止超时，继续重启")
         
         # 重新启动
         start_success = await device_manager.start_device(device_id)
         if start_success:
-            return ControlResponse.success(f"设备 {device_id} 重启成功")
+            return control_success(f"设备 {device_id} 重启成功")
         else:
-            return ControlResponse.error(f"重启失败：无法启动设备 {device_id}: {instance.last_error}")
+            return control_error(f"重启失败：无法启动设备 {device_id}: {instance.last_error}")
         
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"重启设备失败 {device_id}: {e}")
-        return ControlResponse.error(f"重启失败: {str(e)}")
-
-# 批量操作API
-@router.post("/batch/start")
-async def start_multiple_devices(device_ids: list[str]):
-    """批量启动多个设备"""
-    if not device_manager:
-        raise HTTPException(status_code=503, detail="设备管理器未初始化")
-    
-    results = {}
-    
-    for device_id in device_ids:
-        try:
-            # 检查或创建设备实例
-            instance = device_manager.get_device_instance(device_id)
-            if not instance:
-                from config_loader import Config
-                stream_config = Config.get_stream_config()
-                audio_config = Config.get_audio_config()
-                
-                instance = device_manager.create_device_instance(
-                    device_id, stream_config, audio_config
-                )
-            
-            success = await device_manager.start_device(device_id)
-            results[device_id] = {
-                "success": success,
-                "message": "启动成功" if success else f"启动失败: {instance.last_error}"
-            }
-            
-        except Exception as e:
-            results[device_id] = {
-                "success": False,
-                "message": f"启动失败: {str(e)}"
-            }
-    
-    return {
-        "results": results,
-        "timestamp": __import__('time').time() * 1000
-    }
-
-@router.post("/batch/stop")
-async def stop_multiple_devices(device_ids: list[str]):
-    """批量停止多个设备"""
-    if not device_manager:
-        raise HTTPException(status_code=503, detail="设备管理器未初始化")
-    
-    results = {}
-    
-    for device_id in device_ids:
-        try:
-            success = await device_manager.stop_device(device_id)
-            results[device_id] = {
-                "success": success,
-                "message": "停止成功" if success else "停止失败"
-            }
-            
-        except Exception as e:
-            results[device_id] = {
-                "success": False,
-                "message": f"停止失败: {str(e)}"
-            }
-    
-    return {
-        "results": results,
-        "timestamp": __import__('time').time() * 1000
-    }
\ No newline at end of file
+        return control_error(f"重启失败: {str(e)}")
\ No newline at end of file
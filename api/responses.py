@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+API响应类
+"""
+from hashlib import blake2b
+from time import time_ns
+from typing import Any, Dict, Optional
+
+import orjson
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+def now_ms() -> int:
+    """当前Unix时间戳（整数毫秒），所有API响应的timestamp字段统一使用"""
+    return time_ns() // 1_000_000
+
+class NPResponse(JSONResponse):
+    """基于orjson的JSON响应，可直接序列化numpy数组和标量"""
+    
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+def control_success(message: Optional[str] = None) -> NPResponse:
+    """成功的控制响应，结构与 ControlResponse.success 相同，但不构造Pydantic模型"""
+    return NPResponse({"status": "success", "message": message, "timestamp": now_ms()})
+
+def control_error(message: str) -> NPResponse:
+    """失败的控制响应，结构与 ControlResponse.error 相同，但不构造Pydantic模型"""
+    return NPResponse({"status": "error", "message": message, "timestamp": now_ms()})
+
+# 随时间自然变化的字段，不参与ETag计算（弱ETag：其余内容相同即视为等价）
+ETAG_IGNORED_KEYS = frozenset({"timestamp", "uptime_seconds"})
+
+def _strip_volatile(value: Any) -> Any:
+    """递归去除不参与ETag计算的字段"""
+    if isinstance(value, dict):
+        return {key: _strip_volatile(item) for key, item in value.items() if key not in ETAG_IGNORED_KEYS}
+    if isinstance(value, list):
+        return [_strip_volatile(item) for item in value]
+    return value
+
+def etag_response(request: Request, content: Dict[str, Any]) -> Response:
+    """带弱ETag的JSON响应，用于轮询的状态端点
+
+    ETag由去除时间戳/运行时长后的内容计算，与 If-None-Match 匹配时返回304空响应
+    """
+    digest = blake2b(orjson.dumps(_strip_volatile(content), option=ORJSON_OPTIONS), digest_size=8).hexdigest()
+    etag = f'W/"{digest}"'
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    return NPResponse(content, headers={"ETag": etag})
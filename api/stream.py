@@ -3,7 +3,7 @@
 SSE流传输API端点
 """
 from fastapi import APIRouter, Request, HTTPException
-from fastapi.responses import StreamingResponse
+from core.data_streamer import EventSourceResponse, SSE_HEADERS
 import logging
 
 logger = logging.getLogger(__name__)
@@ -41,10 +41,11 @@ async def stream_fft_data(request: Request):
     if not data_streamer:
         raise HTTPException(status_code=503, detail="数据流服务未启动")
     
-    logger.info(f"新的SSE连接: {request.client.host}:{request.client.port}")
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("新的SSE连接: %s:%s", request.client.host, request.client.port)
     
     try:
-        return await data_streamer.create_client_stream(request)
+        return data_streamer.create_client_stream(request)
     except Exception as e:
         logger.error(f"创建SSE流失败: {e}")
         raise HTTPException(status_code=500, detail=f"创建数据流失败: {str(e)}")
@@ -76,6 +77,7 @@ async def test_sse(request: Request):
                 "message": "SSE测试开始",
                 "timestamp": time.time() * 1000
             }) + "\n\n"
+            await asyncio.sleep(0)
             
             # 每秒发送测试数据
             while counter < 60:  # 测试1分钟
@@ -102,12 +104,4 @@ async def test_sse(request: Request):
             }
             yield f"data: {json.dumps(error_data)}\n\n"
     
-    return StreamingResponse(
-        test_generator(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "Access-Control-Allow-Origin": "*"
-        }
-    )
\ No newline at end of file
+    return EventSourceResponse(test_generator(), headers=SSE_HEADERS)
\ No newline at end of file
@@ -3,36 +3,82 @@
 系统级控制API端点
 提供多设备管理、系统状态和全局操作
 """
-from fastapi import APIRouter, HTTPException
-from typing import Dict, Any, List
+from fastapi import APIRouter, Depends, HTTPException, Request
+from typing import Dict, Any, List, Optional
+import asyncio
 import logging
+import sys
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
 
 from models import ControlResponse
 from core import DeviceInstanceManager
+from .dependencies import get_device_manager, get_optional_device_manager
+from .cache import get_available_devices_cached, invalidate_available_devices
+from .responses import NPResponse, etag_response, now_ms
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/system", tags=["system-control"])
 
-# 全局组件引用
-device_manager: DeviceInstanceManager = None
+# CPU占用采样：后台任务定期采样，性能端点直接读取最近一次结果
+CPU_SAMPLE_INTERVAL = 1.0  # 秒
+_process = psutil.Process() if psutil else None
+_last_cpu_percent = 0.0
+_last_process_cpu_percent = 0.0
+_cpu_sampler_task: Optional[asyncio.Task] = None
+
+async def _cpu_sampler_loop():
+    """CPU采样循环"""
+    global _last_cpu_percent, _last_process_cpu_percent
+    
+    # 首次调用只建立计数基准
+    psutil.cpu_percent(interval=None)
+    _process.cpu_percent(interval=None)
+    
+    try:
+        while True:
+            await asyncio.sleep(CPU_SAMPLE_INTERVAL)
+            _last_cpu_percent = psutil.cpu_percent(interval=None)
+            _last_process_cpu_percent = _process.cpu_percent(interval=None)
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        logger.error(f"CPU采样循环出错: {e}")
+
+def start_cpu_sampler():
+    """启动CPU采样任务 (未安装psutil时跳过)"""
+    global _cpu_sampler_task
+    if psutil is None or _cpu_sampler_task is not None:
+        return
+    _cpu_sampler_task = asyncio.create_task(_cpu_sampler_loop())
 
-def set_device_manager(manager: DeviceInstanceManager):
-    """设置全局设备管理器"""
-    global device_manager
-    device_manager = manager
+async def stop_cpu_sampler():
+    """停止CPU采样任务"""
+    global _cpu_sampler_task
+    if _cpu_sampler_task is None:
+        return
+    _cpu_sampler_task.cancel()
+    try:
+        await _cpu_sampler_task
+    except asyncio.CancelledError:
+        pass
+    _cpu_sampler_task = None
 
 @router.get("/status")
-async def get_system_status():
+async def get_system_status(
+    request: Request,
+    device_manager: DeviceInstanceManager = Depends(get_device_manager)
+):
     """获取系统整体状态"""
-    if not device_manager:
-        raise HTTPException(status_code=503, detail="设备管理器未初始化")
-    
     try:
         # 获取设备管理器统计
         manager_stats = device_manager.get_manager_stats()
         
         # 获取可用设备列表
-        available_devices = device_manager.get_available_devices()
+        available_devices = await get_available_devices_cached(device_manager)
         
         # 获取所有设备实例状态
         device_instances = {}
@@ -41,28 +87,29 @@ async def get_system_status():
                 "state": instance.state.value,
                 "device_name": instance.device_name,
                 "last_error": instance.last_error,
-                "stats": instance.stats
+                "stats": instance.stats.as_dict()
             }
         
-        return {
+        return etag_response(request, {
             "manager_stats": manager_stats,
             "available_devices": available_devices,
             "device_instances": device_instances,
-            "timestamp": __import__('time').time() * 1000
-        }
+            "timestamp": now_ms()
+        })
         
     except Exception as e:
         logger.error(f"获取系统状态失败: {e}")
         raise HTTPException(status_code=500, detail=f"获取系统状态失败: {str(e)}")
 
 @router.get("/devices")
-async def list_all_devices():
+async def list_all_devices(
+    request: Request,
+    device_manager: DeviceInstanceManager = Depends(get_device_manager)
+):
     """列出所有设备（增强版，包含实例状态）"""
-    if not device_manager:
-        raise HTTPException(status_code=503, detail="设备管理器未初始化")
-    
     try:
-        devices = device_manager.get_available_devices()
+        # 复制缓存项后再附加实例信息
+        devices = [dict(device) for device in await get_available_devices_cached(device_manager)]
         
         # 为每个设备添加详细的实例信息
         for device in devices:
@@ -74,7 +121,7 @@ async def list_all_devices():
                     "exists": True,
                     "state": instance.state.value,
                     "last_error": instance.last_error,
-                    "stats": instance.stats
+                    "stats": instance.stats.as_dict()
                 }
             else:
                 device['instance_info'] = {
@@ -84,74 +131,77 @@ async def list_all_devices():
                     "stats": None
                 }
         
-        return {
+        return etag_response(request, {
             "devices": devices,
             "total_devices": len(devices),
             "device_mapping_stats": device_manager.device_id_manager.get_mapping_stats(),
-            "timestamp": __import__('time').time() * 1000
-        }
+            "timestamp": now_ms()
+        })
         
     except Exception as e:
         logger.error(f"列出设备失败: {e}")
         raise HTTPException(status_code=500, detail=f"列出设备失败: {str(e)}")
 
 @router.post("/devices/refresh")
-async def refresh_device_list():
+async def refresh_device_list(device_manager: DeviceInstanceManager = Depends(get_device_manager)):
     """刷新设备列表（重新扫描系统设备）"""
-    if not device_manager:
-        raise HTTPException(status_code=503, detail="设备管理器未初始化")
-    
     try:
         # 获取最新的设备列表，这会触发设备映射的清理和更新
-        devices = device_manager.get_available_devices()
+        invalidate_available_devices()
+        devices = await get_available_devices_cached(device_manager)
         
         return {
             "message": "设备列表已刷新",
             "devices_count": len(devices),
             "devices": devices,
-            "timestamp": __import__('time').time() * 1000
+            "timestamp": now_ms()
         }
         
     except Exception as e:
         logger.error(f"刷新设备列表失败: {e}")
         raise HTTPException(status_code=500, detail=f"刷新失败: {str(e)}")
 
+def _cleanup_missing_mappings(sd, device_id_manager):
+    """枚举系统设备并移除已不存在设备的映射（阻塞，需在线程池中执行）"""
+    device_id_manager.cleanup_missing_devices(sd.query_devices())
+
 @router.post("/cleanup")
-async def cleanup_system():
+async def cleanup_system(device_manager: DeviceInstanceManager = Depends(get_device_manager)):
     """系统清理（清理错误设备、无效映射等）"""
-    if not device_manager:
-        raise HTTPException(status_code=503, detail="设备管理器未初始化")
-    
     try:
-        # 清理错误设备
-        await device_manager.cleanup_error_devices()
-        
-        # 清理设备映射
         import sounddevice as sd
-        devices = sd.query_devices()
-        device_manager.device_id_manager.cleanup_missing_devices(devices)
+        
+        # 清理错误设备的同时在线程池中枚举系统设备并清理设备映射
+        # （PortAudio调用和映射文件写入都会阻塞事件循环）
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(device_manager.cleanup_error_devices())
+            tg.create_task(asyncio.to_thread(
+                _cleanup_missing_mappings, sd, device_manager.device_id_manager
+            ))
+        invalidate_available_devices()
         
         return {
             "message": "系统清理完成",
-            "timestamp": __import__('time').time() * 1000
+            "timestamp": now_ms()
         }
         
     except Exception as e:
+        # TaskGroup失败时抛出ExceptionGroup，取第一个子异常作为错误信息
+        if isinstance(e, ExceptionGroup):
+            e = e.exceptions[0]
         logger.error(f"系统清理失败: {e}")
         raise HTTPException(status_code=500, detail=f"系统清理失败: {str(e)}")
 
 @router.post("/stop-all")
-async def stop_all_devices():
+async def stop_all_devices(device_manager: DeviceInstanceManager = Depends(get_device_manager)):
     """停止所有运行中的设备"""
-    if not device_manager:
-        raise HTTPException(status_code=503, detail="设备管理器未初始化")
-    
     try:
         await device_manager.stop_all_devices()
+        invalidate_available_devices()
         
         return {
             "message": "所有设备已停止",
-            "timestamp": __import__('time').time() * 1000
+            "timestamp": now_ms()
         }
         
     except Exception as e:
@@ -159,13 +209,15 @@ async def stop_all_devices():
         raise HTTPException(status_code=500, detail=f"停止失败: {str(e)}")
 
 @router.get("/health")
-async def system_health_check():
+async def system_health_check(
+    device_manager: Optional[DeviceInstanceManager] = Depends(get_optional_device_manager)
+):
     """系统健康检查"""
     if not device_manager:
         return {
             "status": "unhealthy",
             "reason": "设备管理器未初始化",
-            "timestamp": __import__('time').time() * 1000
+            "timestamp": now_ms()
         }
     
     try:
@@ -188,34 +240,39 @@ async def system_health_check():
             "status": "healthy" if is_healthy else "degraded",
             "issues": issues,
             "manager_stats": manager_stats,
-            "timestamp": __import__('time').time() * 1000
+            "timestamp": now_ms()
         }
         
     except Exception as e:
         return {
             "status": "unhealthy",
             "reason": str(e),
-            "timestamp": __import__('time').time() * 1000
+            "timestamp": now_ms()
         }
 
 @router.get("/performance")
-async def get_system_performance():
+async def get_system_performance(
+    device_manager: DeviceInstanceManager = Depends(get_device_manager)
+):
     """获取系统性能统计"""
-    if not device_manager:
-        raise HTTPException(status_code=503, detail="设备管理器未初始化")
+    if psutil is None:
+        # psutil 未安装时的降级响应
+        manager_stats = device_manager.get_manager_stats()
+        
+        return {
+            "message": "完整性能监控需要安装psutil",
+            "basic_stats": manager_stats,
+            "timestamp": now_ms()
+        }
     
     try:
-        import psutil
-        import sys
-        
-        # 系统资源使用情况
-        cpu_percent = psutil.cpu_percent(interval=1)
+        # 系统资源使用情况 (CPU占用取后台采样的最近值，不阻塞事件循环)
+        cpu_percent = _last_cpu_percent
         memory = psutil.virtual_memory()
         
         # 进程资源使用情况
-        process = psutil.Process()
-        process_memory = process.memory_info()
-        process_cpu = process.cpu_percent()
+        process_memory = _process.memory_info()
+        process_cpu = _last_process_cpu_percent
         
         # 设备统计
         manager_stats = device_manager.get_manager_stats()
@@ -225,10 +282,10 @@ async def get_system_performance():
         total_frames_sent = 0
         
         for instance in device_manager.get_all_device_instances().values():
-            total_frames_processed += instance.stats.get("frames_processed", 0)
-            total_frames_sent += instance.stats.get("frames_sent", 0)
+            total_frames_processed += instance.stats.frames_processed
+            total_frames_sent += instance.stats.frames_sent
         
-        return {
+        return NPResponse({
             "system_resources": {
                 "cpu_percent": cpu_percent,
                 "memory_total_gb": round(memory.total / (1024**3), 2),
@@ -239,7 +296,7 @@ async def get_system_performance():
                 "memory_mb": round(process_memory.rss / (1024**2), 2),
                 "cpu_percent": process_cpu,
                 "python_version": sys.version,
-                "thread_count": process.num_threads()
+                "thread_count": _process.num_threads()
             },
             "device_performance": {
                 "total_devices": manager_stats["total_instances"],
@@ -247,28 +304,16 @@ async def get_system_performance():
                 "total_frames_processed": total_frames_processed,
                 "total_frames_sent": total_frames_sent
             },
-            "timestamp": __import__('time').time() * 1000
-        }
+            "timestamp": now_ms()
+        })
         
-    except ImportError:
-        # psutil 未安装时的降级响应
-        manager_stats = device_manager.get_manager_stats()
-        
-        return {
-            "message": "完整性能监控需要安装psutil",
-            "basic_stats": manager_stats,
-            "timestamp": __import__('time').time() * 1000
-        }
     except Exception as e:
         logger.error(f"获取性能统计失败: {e}")
         raise HTTPException(status_code=500, detail=f"获取性能统计失败: {str(e)}")
 
 @router.get("/config/limits")
-async def get_system_limits():
+async def get_system_limits(device_manager: DeviceInstanceManager = Depends(get_device_manager)):
     """获取系统限制配置"""
-    if not device_manager:
-        raise HTTPException(status_code=503, detail="设备管理器未初始化")
-    
     return {
         "max_concurrent_devices": device_manager.max_concurrent_devices,
         "current_device_count": len(device_manager.device_instances),
@@ -276,15 +321,15 @@ async def get_system_limits():
             d for d in device_manager.device_instances.values() 
             if d.state.value == "running"
         ]),
-        "timestamp": __import__('time').time() * 1000
+        "timestamp": now_ms()
     }
 
 @router.post("/config/limits")
-async def update_system_limits(max_concurrent_devices: int):
+async def update_system_limits(
+    max_concurrent_devices: int,
+    device_manager: DeviceInstanceManager = Depends(get_device_manager)
+):
     """更新系统限制配置"""
-    if not device_manager:
-        raise HTTPException(status_code=503, detail="设备管理器未初始化")
-    
     if max_concurrent_devices < 1 or max_concurrent_devices > 16:
         raise HTTPException(
             status_code=400, 
@@ -296,5 +341,5 @@ async def update_system_limits(max_concurrent_devices: int):
     return {
         "message": f"系统限制已更新，最大并发设备数: {max_concurrent_devices}",
         "max_concurrent_devices": max_concurrent_devices,
-        "timestamp": __import__('time').time() * 1000
+        "timestamp": now_ms()
     }
\ No newline at end of file
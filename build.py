@@ -17,16 +17,19 @@ def main():
     # PyInstaller 命令
     cmd = [
         'pyinstaller',
-        '--onedir',  # 创建目录而不是单个文件（更快）
+        '--onedir',  # 创建目录而不是单个文件（更快，onefile每次启动都要解压）
         '--console',
+        '--noupx',  # 不用UPX压缩，避免启动时解压拖慢冷启动
+        '--optimize', '2',  # 字节码预编译为-OO级别（去掉assert和docstring），缩短导入时间
         '--name', 'headless_ultrasonic',
         '--add-data', 'core/device_mapping.json:core',
         '--add-data', 'core/device_configs.json:core',
         '--hidden-import', 'uvicorn.main',
+        '--hidden-import', 'uvicorn.loops.uvloop',
+        '--hidden-import', 'uvicorn.protocols.http.httptools_impl',
         '--hidden-import', 'sounddevice',
         '--hidden-import', 'numpy',
-        '--hidden-import', 'scipy.signal',
-        '--hidden-import', 'scipy.fft',
+        '--hidden-import', 'scipy.signal',  # FFT窗函数 get_window
         '--exclude-module', 'matplotlib',
         '--exclude-module', 'pandas', 
         '--exclude-module', 'tensorflow',
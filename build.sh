@@ -36,6 +36,7 @@ fi
 # 执行编译
 echo "🔨 开始PyInstaller编译..."
 pyinstaller --onedir \
+  --noupx \
   --collect-all scipy \
   --collect-all numpy \
   --hidden-import sounddevice \
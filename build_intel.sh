@@ -53,6 +53,7 @@ OUTPUT_NAME="headless_ultrasonic_intel"
 # 执行编译
 echo "🔨 开始PyInstaller编译 (Intel x86_64 目录模式)..."
 pyinstaller --onedir \
+  --noupx \
   --collect-all scipy \
   --collect-all numpy \
   --hidden-import sounddevice \
@@ -80,6 +80,7 @@ echo "🔨 开始PyInstaller单文件编译 (${TARGET_ARCH})..."
 # 清除可能影响的环境变量
 unset HOST HOSTNAME
 pyinstaller --onefile \
+  --noupx \
   --collect-all scipy \
   --collect-all numpy \
   --hidden-import sounddevice \
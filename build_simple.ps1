@@ -61,6 +61,7 @@ Write-Host "Starting PyInstaller build ($targetArch)..." -ForegroundColor Cyan
 
 $pyinstallerArgs = @(
     "--onefile"
+    "--noupx"
     "--collect-all", "scipy"
     "--collect-all", "numpy"
     "--hidden-import", "sounddevice"
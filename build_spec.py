@@ -29,11 +29,12 @@ data_files = [
 # 需要包含的隐式导入
 hidden_imports = [
     'uvicorn',
+    'uvicorn.loops.uvloop',
+    'uvicorn.protocols.http.httptools_impl',
     'fastapi',
     'sounddevice',
     'numpy',
     'scipy',
-    'pako',
     'asyncio',
     'threading',
     'multiprocessing',
@@ -53,8 +54,6 @@ hidden_imports = [
     'starlette.middleware.cors',
     # 其他可能需要的模块
     'pydantic',
-    'email_validator',
-    'python_multipart',
 ]
 
 # PyInstaller Analysis 配置
@@ -81,6 +80,7 @@ a = Analysis(
     win_private_assemblies=False,
     cipher=None,
     noarchive=False,
+    optimize=2,  # 字节码预编译为-OO级别（去掉assert和docstring），缩短导入时间
 )
 
 pyz = PYZ(a.pure, a.zipped_data, cipher=None)
@@ -96,8 +96,7 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
-    upx_exclude=[],
+    upx=False,  # UPX压缩的二进制每次启动都要先解压到内存，拖慢冷启动
     runtime_tmpdir=None,
     console=True,  # 保持控制台输出以便调试
     disable_windowed_traceback=False,
@@ -46,6 +46,7 @@ OUTPUT_NAME="headless_ultrasonic_${ARCH_NAME}"
 # 执行编译 - 目录模式，Universal 二进制
 echo "🔨 开始PyInstaller编译 (目录模式，Universal二进制)..."
 pyinstaller --onedir \
+  --noupx \
   --collect-all scipy \
   --collect-all numpy \
   --hidden-import sounddevice \
@@ -3,6 +3,7 @@
 配置管理
 """
 import os
+from functools import cache
 from pathlib import Path
 from models import StreamConfig, AudioConfig
 
@@ -23,32 +24,52 @@ class Config:
     
     @classmethod
     def get_stream_config(cls) -> StreamConfig:
-        """获取默认流配置"""
-        return StreamConfig(
-            target_fps=int(os.getenv("TARGET_FPS", "30")),
-            compression_level=int(os.getenv("COMPRESSION_LEVEL", "6")),
-            enable_adaptive_fps=os.getenv("ADAPTIVE_FPS", "true").lower() == "true",
-            min_fps=int(os.getenv("MIN_FPS", "5")),
-            max_fps=int(os.getenv("MAX_FPS", "60")),
-            magnitude_threshold_db=float(os.getenv("MAGNITUDE_THRESHOLD", "-80.0")),
-            enable_smart_skip=os.getenv("SMART_SKIP", "false").lower() == "true",
-            similarity_threshold=float(os.getenv("SIMILARITY_THRESHOLD", "0.95"))
-        )
+        """获取默认流配置（返回副本，调用方可以修改）"""
+        return _build_stream_config().model_copy()
     
     @classmethod  
     def get_audio_config(cls) -> AudioConfig:
-        """获取默认音频配置"""
-        device_names = os.getenv("DEVICE_NAMES", "UltraMic384K,UltraMic,384K").split(",")
-        fallback_device = os.getenv("FALLBACK_DEVICE")
-        
-        return AudioConfig(
-            device_names=device_names,
-            fallback_device_id=int(fallback_device) if fallback_device else None,
-            sample_rate=int(os.getenv("SAMPLE_RATE", "384000")),
-            channels=int(os.getenv("CHANNELS", "1")),
-            blocksize=int(os.getenv("BLOCKSIZE", "3840")),
-            fft_size=int(os.getenv("FFT_SIZE", "8192")),
-            overlap=float(os.getenv("OVERLAP", "0.75")),
-            window_type=os.getenv("WINDOW_TYPE", "hann"),
-            threshold_db=float(os.getenv("THRESHOLD_DB", "-100.0"))
-        )
\ No newline at end of file
+        """获取默认音频配置（返回副本，调用方可以修改）"""
+        audio_config = _build_audio_config()
+        return audio_config.model_copy(update={"device_names": list(audio_config.device_names)})
+    
+    @classmethod
+    def refresh(cls):
+        """丢弃已解析的默认配置，下次获取时重新读取环境变量（环境变量在运行期变化时调用）"""
+        _build_stream_config.cache_clear()
+        _build_audio_config.cache_clear()
+
+# 默认配置在首次获取时从环境变量解析一次，之后复用（Config.refresh()可重置）
+@cache
+def _build_stream_config() -> StreamConfig:
+    """从环境变量构建默认流配置"""
+    return StreamConfig(
+        target_fps=int(os.getenv("TARGET_FPS", "30")),
+        compression_level=int(os.getenv("COMPRESSION_LEVEL", "6")),
+        enable_adaptive_fps=os.getenv("ADAPTIVE_FPS", "true").lower() == "true",
+        min_fps=int(os.getenv("MIN_FPS", "5")),
+        max_fps=int(os.getenv("MAX_FPS", "60")),
+        magnitude_threshold_db=float(os.getenv("MAGNITUDE_THRESHOLD", "-80.0")),
+        enable_smart_skip=os.getenv("SMART_SKIP", "false").lower() == "true",
+        similarity_threshold=float(os.getenv("SIMILARITY_THRESHOLD", "0.95")),
+        data_format=os.getenv("DATA_FORMAT", "float32")
+    )
+
+@cache
+def _build_audio_config() -> AudioConfig:
+    """从环境变量构建默认音频配置"""
+    device_names = os.getenv("DEVICE_NAMES", "UltraMic384K,UltraMic,384K").split(",")
+    fallback_device = os.getenv("FALLBACK_DEVICE")
+    
+    return AudioConfig(
+        device_names=device_names,
+        fallback_device_id=int(fallback_device) if fallback_device else None,
+        sample_rate=int(os.getenv("SAMPLE_RATE", "384000")),
+        channels=int(os.getenv("CHANNELS", "1")),
+        blocksize=int(os.getenv("BLOCKSIZE", "3840")),
+        fft_size=int(os.getenv("FFT_SIZE", "8192")),
+        overlap=float(os.getenv("OVERLAP", "0.75")),
+        window_type=os.getenv("WINDOW_TYPE", "hann"),
+        threshold_db=float(os.getenv("THRESHOLD_DB", "-100.0")),
+        fft_backend=os.getenv("FFT_BACKEND", "numpy")
+    )
\ No newline at end of file
@@ -58,7 +58,8 @@ def get_default_config() -> Dict[str, Any]:
             "max_fps": 60,
             "magnitude_threshold_db": -80.0,
             "enable_smart_skip": False,
-            "similarity_threshold": 0.95
+            "similarity_threshold": 0.95,
+            "data_format": "float32"
         },
         "audio": {
             "device_names": ["UltraMic384K", "UltraMic", "384K"],
@@ -69,7 +70,8 @@ def get_default_config() -> Dict[str, Any]:
             "fft_size": 8192,
             "overlap": 0.75,
             "window_type": "hann",
-            "threshold_db": -100.0
+            "threshold_db": -100.0,
+            "fft_backend": "numpy"
         }
     }
 
@@ -84,73 +86,69 @@ def get_config() -> Dict[str, Any]:
     return _config
 
 class Config:
-    """兼容旧代码的配置类"""
+    """兼容旧代码的配置类
+
+    环境变量覆盖项在构造时解析一次，之后的访问都是普通属性读取
+    """
     
     def __init__(self):
         self._cfg = get_config()
+        self.refresh()
     
-    @property
-    def HOST(self):
-        return os.getenv("HOST", self._cfg["server"]["host"])
-    
-    @property
-    def PORT(self):
-        return int(os.getenv("PORT", str(self._cfg["server"]["port"])))
-    
-    @property
-    def DEBUG(self):
+    def refresh(self):
+        """重新读取环境变量覆盖项（环境变量在运行期变化时调用）"""
+        from models import StreamConfig, AudioConfig
+        cfg = self._cfg
+        
+        self.HOST = os.getenv("HOST", cfg["server"]["host"])
+        self.PORT = int(os.getenv("PORT", str(cfg["server"]["port"])))
         debug_env = os.getenv("DEBUG")
-        if debug_env:
-            return debug_env.lower() == "true"
-        return self._cfg["server"]["debug"]
-    
-    @property
-    def LOG_LEVEL(self):
-        return os.getenv("LOG_LEVEL", self._cfg["logging"]["level"])
-    
-    @property
-    def LOG_FORMAT(self):
-        return self._cfg["logging"]["format"]
-    
-    @property
-    def DATA_DIR(self):
-        return Path(os.getenv("DATA_DIR", self._cfg["data"]["data_dir"]))
-    
-    def get_stream_config(self):
-        """获取流配置"""
-        from models import StreamConfig
-        cfg = self._cfg["stream"]
-        return StreamConfig(
-            target_fps=int(os.getenv("TARGET_FPS", str(cfg["target_fps"]))),
-            compression_level=int(os.getenv("COMPRESSION_LEVEL", str(cfg["compression_level"]))),
-            enable_adaptive_fps=cfg["enable_adaptive_fps"],
-            min_fps=cfg["min_fps"],
-            max_fps=cfg["max_fps"],
-            magnitude_threshold_db=cfg["magnitude_threshold_db"],
-            enable_smart_skip=cfg["enable_smart_skip"],
-            similarity_threshold=cfg["similarity_threshold"]
+        self.DEBUG = debug_env.lower() == "true" if debug_env else cfg["server"]["debug"]
+        self.LOG_LEVEL = os.getenv("LOG_LEVEL", cfg["logging"]["level"])
+        self.LOG_FORMAT = cfg["logging"]["format"]
+        self.DATA_DIR = Path(os.getenv("DATA_DIR", cfg["data"]["data_dir"]))
+        
+        stream_cfg = cfg["stream"]
+        self._stream_config = StreamConfig(
+            target_fps=int(os.getenv("TARGET_FPS", str(stream_cfg["target_fps"]))),
+            compression_level=int(os.getenv("COMPRESSION_LEVEL", str(stream_cfg["compression_level"]))),
+            enable_adaptive_fps=stream_cfg["enable_adaptive_fps"],
+            min_fps=stream_cfg["min_fps"],
+            max_fps=stream_cfg["max_fps"],
+            magnitude_threshold_db=stream_cfg["magnitude_threshold_db"],
+            enable_smart_skip=stream_cfg["enable_smart_skip"],
+            similarity_threshold=stream_cfg["similarity_threshold"],
+            data_format=os.getenv("DATA_FORMAT", stream_cfg.get("data_format", "float32"))
         )
-    
-    def get_audio_config(self):
-        """获取音频配置"""
-        from models import AudioConfig
-        cfg = self._cfg["audio"]
+        
+        audio_cfg = cfg["audio"]
         device_names = os.getenv("DEVICE_NAMES")
         if device_names:
             device_names = device_names.split(",")
         else:
-            device_names = cfg["device_names"]
-            
-        return AudioConfig(
+            device_names = audio_cfg["device_names"]
+        
+        self._audio_config = AudioConfig(
             device_names=device_names,
-            fallback_device_id=cfg["fallback_device_id"],
-            sample_rate=int(os.getenv("SAMPLE_RATE", str(cfg["sample_rate"]))),
-            channels=cfg["channels"],
-            blocksize=cfg["blocksize"],
-            fft_size=cfg["fft_size"],
-            overlap=cfg["overlap"],
-            window_type=cfg["window_type"],
-            threshold_db=cfg["threshold_db"]
+            fallback_device_id=audio_cfg["fallback_device_id"],
+            sample_rate=int(os.getenv("SAMPLE_RATE", str(audio_cfg["sample_rate"]))),
+            channels=audio_cfg["channels"],
+            blocksize=audio_cfg["blocksize"],
+            fft_size=audio_cfg["fft_size"],
+            overlap=audio_cfg["overlap"],
+            window_type=audio_cfg["window_type"],
+            threshold_db=audio_cfg["threshold_db"],
+            fft_backend=os.getenv("FFT_BACKEND", audio_cfg.get("fft_backend", "numpy"))
+        )
+    
+    def get_stream_config(self):
+        """获取流配置（返回副本，调用方可以修改）"""
+        return self._stream_config.model_copy()
+    
+    def get_audio_config(self):
+        """获取音频配置（返回副本，调用方可以修改）"""
+        return self._audio_config.model_copy(
+            update={"device_names": list(self._audio_config.device_names)}
         )
 
 # 创建全局配置实例
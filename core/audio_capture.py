@@ -36,7 +36,12 @@ class AudioCapture:
         self.is_running = False
         self._stop_event = Event()
         self._capture_thread = None
-        self._callbacks = []
+        
+        # 音频流真正关闭（采集线程退出）时置位，并在采集线程中调用on_stream_closed
+        self.stream_closed = Event()
+        self.stream_closed.set()
+        self.on_stream_closed: Optional[Callable[[], None]] = None
+        self._callbacks = ()  # 不可变元组，增删时整体替换，分发线程可无锁遍历
         
         # 性能统计
         self.frames_captured = 0
@@ -49,21 +54,45 @@ class AudioCapture:
         self.callback_timeout = 10.0  # 10秒没有回调认为设备断开 (为MacBook Air麦克风增加容忍度)
         self.device_disconnected = False
         
+        # 音频回调只把原始样本复制进环形缓冲区（单生产者/单消费者），
+        # 由分发线程完成float32转换并调用回调函数，避免阻塞PortAudio实时线程。
+        # 容量至少0.5秒样本：blocksize=0（PortAudio可变块大小）时也能正常工作
+        ring_frames = max(self.blocksize * 64, int(self.sample_rate) // 2)
+        self._ring = np.empty(ring_frames * self.channels, dtype=self.dtype)
+        self._ring_head = 0  # 累计写入样本数，仅音频回调修改
+        self._ring_tail = 0  # 累计读出样本数，仅分发线程修改
+        self._ring_blocks = deque()  # 每块的(样本数, 时间戳)
+        self._data_ready = Event()
+        self.frames_dropped = 0
+        
+        # 实时线程中只记录回调状态/异常，由分发线程输出日志（两次输出之间只保留最新一条）
+        self._pending_status = None
+        self._pending_error = None
+        
+        # 分发线程中int16->float32转换使用的预分配缓冲区
+        self._scratch_f32 = np.empty(self.blocksize * self.channels, dtype=np.float32)
+        self._inv_scale = np.float32(1.0 / 32768.0)
+        
     def add_callback(self, callback: Callable[[np.ndarray, float], None]):
         """添加音频数据回调函数
         
         Args:
             callback: 回调函数，接收(audio_data: np.ndarray, timestamp: float)
+                audio_data 是复用的缓冲区，回调返回后会被下一块数据覆盖，
+                需要保留时请在回调内复制
         """
-        self._callbacks.append(callback)
+        self._callbacks = (*self._callbacks, callback)
         
     def remove_callback(self, callback: Callable):
         """移除回调函数"""
         if callback in self._callbacks:
-            self._callbacks.remove(callback)
+            callbacks = list(self._callbacks)
+            callbacks.remove(callback)
+            self._callbacks = tuple(callbacks)
     
     def find_device(self) -> Optional[int]:
         """查找音频设备"""
+        devices = None
         try:
             devices = sd.query_devices()
             
@@ -97,10 +126,11 @@ class AudioCapture:
         except Exception as e:
             logger.error(f"查找设备时发生错误: {e}")
             
-        # 列出所有可用设备供调试
+        # 列出所有可用设备供调试（复用上面的查询结果，查询失败时才重新查询）
         logger.info("可用输入设备:")
         try:
-            devices = sd.query_devices()
+            if devices is None:
+                devices = sd.query_devices()
             for i, device in enumerate(devices):
                 if device['max_input_channels'] > 0:
                     logger.info(f"  {i}: {device['name']}")
@@ -123,6 +153,7 @@ class AudioCapture:
                 return False
                 
             self._stop_event.clear()
+            self.stream_closed.clear()
             self._capture_thread = Thread(target=self._capture_loop, daemon=True)
             self._capture_thread.start()
             
@@ -138,6 +169,8 @@ class AudioCapture:
         except Exception as e:
             self.last_error = f"启动音频采集失败: {e}"
             logger.error(self.last_error)
+            if not (self._capture_thread and self._capture_thread.is_alive()):
+                self.stream_closed.set()
             return False
     
     def stop(self):
@@ -154,43 +187,79 @@ class AudioCapture:
             
         logger.info("音频采集已停止")
     
-    def _capture_loop(self):
-        """音频采集主循环"""
+    def _make_audio_callback(self):
+        """创建PortAudio音频回调
+
+        回调中用到的对象和函数在这里绑定为闭包变量，避免实时线程中每次调用都做全局/属性查找
+        """
+        ring = self._ring
+        capacity = len(ring)
+        dtype = self.dtype
+        channels = self.channels
+        ring_blocks_append = self._ring_blocks.append
+        notify_ready = self._data_ready.set
+        frombuffer = np.frombuffer
+        clock = time.time
+        
         def audio_callback(indata, frames, time_info, status):
             if not self.is_running:
                 return
                 
             if status:
-                logger.warning(f"音频回调状态: {status}")
-                # 检查是否是设备断开错误
-                if 'input underflow' in str(status).lower() or 'device' in str(status).lower():
-                    logger.error(f"疑似设备断开: {status}")
+                self._pending_status = status
+                notify_ready()
+                # 检查是否是设备断开错误（直接读标志位，实时线程中不生成字符串）
+                if status.input_underflow:
                     self.device_disconnected = True
                     return
                 
             try:
-                # 转换为float并归一化
-                audio_float = indata.flatten().astype(np.float32) / 32768.0
+                # RawInputStream给出的是原始缓冲区，直接包装为数组（不复制）
+                samples = frombuffer(indata, dtype=dtype, count=frames * channels)
+                n = samples.size
                 
-                # 记录统计信息
-                self.frames_captured += 1
-                self.bytes_captured += len(audio_float) * 4  # float32 = 4 bytes
-                self.last_callback_time = time.time()  # 更新最后回调时间
+                now = clock()  # 每次回调只取一次时间
+                self.last_callback_time = now  # 更新最后回调时间
                 self.device_disconnected = False  # 收到数据说明设备正常
                 
-                # 调用所有回调函数，传入时间戳
-                timestamp = time.time() * 1000  # 毫秒时间戳
-                for callback in self._callbacks:
-                    try:
-                        callback(audio_float, timestamp)
-                    except Exception as e:
-                        logger.error(f"音频回调函数出错: {e}")
+                # 缓冲区已满（分发线程跟不上），丢弃本块
+                head = self._ring_head
+                if head - self._ring_tail + n > capacity:
+                    self.frames_dropped += 1
+                    return
+                
+                # 复制到环形缓冲区（可能跨越末尾）
+                pos = head % capacity
+                first = min(n, capacity - pos)
+                ring[pos:pos + first] = samples[:first]
+                if first < n:
+                    ring[:n - first] = samples[first:]
+                
+                ring_blocks_append((n, now * 1000))  # 毫秒时间戳
+                self._ring_head = head + n
+                notify_ready()
                         
             except Exception as e:
-                logger.error(f"音频数据处理出错: {e}")
+                self._pending_error = e
+                notify_ready()
+        
+        return audio_callback
+    
+    def _capture_loop(self):
+        """音频采集主循环"""
+        audio_callback = self._make_audio_callback()
+        
+        # 每次打开音频流时重置环形缓冲区并启动分发线程
+        self._ring_head = 0
+        self._ring_tail = 0
+        self._ring_blocks.clear()
+        self._data_ready.clear()
+        dispatch_stop = Event()
+        dispatch_thread = Thread(target=self._dispatch_loop, args=(dispatch_stop,), daemon=True)
+        dispatch_thread.start()
         
         try:
-            with sd.InputStream(
+            with sd.RawInputStream(
                 device=self.device,
                 channels=self.channels,
                 samplerate=self.sample_rate,
@@ -218,10 +287,82 @@ class AudioCapture:
             self.last_error = f"音频流错误: {e}"
             logger.error(self.last_error)
             self.is_running = False
+        finally:
+            dispatch_stop.set()
+            self._data_ready.set()
+            dispatch_thread.join(timeout=2.0)
+            
+            self.stream_closed.set()
+            on_stream_closed = self.on_stream_closed
+            if on_stream_closed is not None:
+                try:
+                    on_stream_closed()
+                except Exception as e:
+                    logger.error(f"音频流关闭回调错误: {e}")
+    
+    def _dispatch_loop(self, dispatch_stop: Event):
+        """分发线程：从环形缓冲区取出数据块，转换为float32后调用所有回调函数"""
+        ring = self._ring
+        capacity = len(ring)
+        
+        while not dispatch_stop.is_set():
+            self._data_ready.wait(0.1)
+            self._data_ready.clear()
+            
+            self._log_callback_events()
+            
+            while self._ring_blocks:
+                n, timestamp = self._ring_blocks.popleft()
+                try:
+                    # 转换为float并归一化（直接写入预分配缓冲区）
+                    if n != self._scratch_f32.size:
+                        self._scratch_f32 = np.empty(n, dtype=np.float32)
+                    audio_float = self._scratch_f32
+                    
+                    pos = self._ring_tail % capacity
+                    first = min(n, capacity - pos)
+                    # 指定float32内循环：int16->float32转换与缩放在同一次向量化遍历中完成
+                    np.multiply(ring[pos:pos + first], self._inv_scale,
+                                out=audio_float[:first], dtype=np.float32, casting='unsafe')
+                    if first < n:
+                        np.multiply(ring[:n - first], self._inv_scale,
+                                    out=audio_float[first:], dtype=np.float32, casting='unsafe')
+                    
+                    # 记录统计信息
+                    self.frames_captured += 1
+                    self.bytes_captured += n * 4  # float32 = 4 bytes
+                    
+                    # 调用所有回调函数，传入时间戳
+                    for callback in self._callbacks:
+                        try:
+                            callback(audio_float, timestamp)
+                        except Exception as e:
+                            logger.error(f"音频回调函数出错: {e}")
+                            
+                except Exception as e:
+                    logger.error(f"音频数据处理出错: {e}")
+                finally:
+                    self._ring_tail += n
+    
+    def _log_callback_events(self):
+        """输出音频回调记录的状态和异常（在分发线程中调用）"""
+        status = self._pending_status
+        if status is not None:
+            self._pending_status = None
+            logger.warning(f"音频回调状态: {status}")
+            status_text = str(status).lower()
+            if 'input underflow' in status_text or 'device' in status_text:
+                logger.error(f"疑似设备断开: {status}")
+        
+        error = self._pending_error
+        if error is not None:
+            self._pending_error = None
+            logger.error(f"音频数据处理出错: {error}")
     
     def get_stats(self) -> dict:
         """获取采集统计信息"""
-        uptime = time.time() - self.start_time if self.start_time else 0
+        now = time.time()
+        uptime = now - self.start_time if self.start_time else 0
         
         return {
             "is_running": self.is_running,
@@ -232,8 +373,9 @@ class AudioCapture:
             "fps": self.frames_captured / uptime if uptime > 0 else 0,
             "last_error": self.last_error,
             "device_disconnected": self.device_disconnected,
+            "frames_dropped": self.frames_dropped,
             "last_callback_time": self.last_callback_time,
-            "callback_health": "healthy" if time.time() - self.last_callback_time < self.callback_timeout else "timeout"
+            "callback_health": "healthy" if now - self.last_callback_time < self.callback_timeout else "timeout"
         }
     
     def __del__(self):
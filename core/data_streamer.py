@@ -7,42 +7,86 @@ import asyncio
 import json
 import time
 import logging
-from typing import Set, Optional, Dict, Any
+from typing import Set, Optional, Dict, Any, List, Tuple, Deque
 from collections import deque
 from fastapi import Request
 from fastapi.responses import StreamingResponse
+from pydantic_core import to_json
 from models import FFTFrame, StreamConfig
 
+try:
+    # FastAPI >= 0.135 自带SSE响应类
+    from fastapi.sse import EventSourceResponse
+except ImportError:
+    class EventSourceResponse(StreamingResponse):
+        """text/event-stream 流式响应（旧版FastAPI回退）"""
+        media_type = "text/event-stream"
+
 logger = logging.getLogger(__name__)
 
+# SSE响应头：禁止缓存，关闭反向代理(nginx)缓冲，并声明不压缩
+# (GZipMiddleware等压缩中间件会跳过已带Content-Encoding的响应，避免帧被攒进压缩窗口)
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+    "Content-Encoding": "identity",
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "Cache-Control"
+}
+
+# 每发送多少帧检查一次客户端是否断开（60FPS下约0.5秒）
+DISCONNECT_CHECK_INTERVAL = 30
+
+# SSE消息的前缀/后缀
+_SSE_PREFIX = b"data: "
+_SSE_SUFFIX = b"\n\n"
+
 class DataStreamer:
     """SSE数据流管理器"""
     
-    def __init__(self, stream_config: StreamConfig):
+    def __init__(self, stream_config: StreamConfig,
+                 max_queue_size: int = 120, slow_client_timeout: float = 5.0):
+        """
+        Args:
+            stream_config: 流配置
+            max_queue_size: 每个客户端的队列上限 (默认60FPS*2秒缓冲)
+            slow_client_timeout: 队列持续满载超过该秒数的客户端将被断开
+        """
         self.config = stream_config
         self.clients: Set[str] = set()  # 客户端ID集合
-        self.client_queues: Dict[str, asyncio.Queue] = {}  # 每个客户端的数据队列
+        # 每个客户端的数据队列（已编码的SSE消息）及其"有新数据"事件；
+        # 单生产者/单消费者，有界deque满时自动丢弃最旧帧，比asyncio.Queue开销小
+        self.client_queues: Dict[str, Tuple[Deque[bytes], asyncio.Event]] = {}
+        self._client_queue_list: List[Tuple[str, Deque[bytes], asyncio.Event]] = []  # 广播用快照，增删客户端时重建
+        self.max_queue_size = max_queue_size
+        self.slow_client_timeout = slow_client_timeout
+        self._clients_present = asyncio.Event()  # 有客户端连接时置位，空闲的处理循环在此等待
+        self.client_full_since: Dict[str, int] = {}  # 客户端队列开始满载的时间（monotonic纳秒）
         self.is_streaming = False
         self.sequence_id = 0
         
         # 统计信息
         self.total_frames_sent = 0
         self.total_bytes_sent = 0
+        self.slow_clients_total = 0  # 因消费过慢被断开的客户端数
         self.start_time = time.time()
-        self.fps_history = deque(maxlen=60)  # 记录最近60帧的时间
+        self._ema_frame_interval = 0.0  # 帧间隔的指数移动平均（秒）
         
         # 自适应控制
         self.current_fps = stream_config.target_fps
-        self.last_frame_time = 0
+        self.last_frame_ns = 0  # 上一帧广播时间（time.monotonic_ns()，0表示尚未发送）
         
         logger.info(f"数据流管理器初始化完成, 目标FPS: {stream_config.target_fps}")
     
-    def add_client(self, client_id: str) -> asyncio.Queue:
+    def add_client(self, client_id: str) -> Tuple[Deque[bytes], asyncio.Event]:
         """添加客户端"""
         if client_id not in self.clients:
             self.clients.add(client_id)
-            self.client_queues[client_id] = asyncio.Queue(maxsize=120)  # 支持60FPS*2秒缓冲，防止帧丢失
-            logger.info(f"客户端连接: {client_id} (总数: {len(self.clients)})")
+            self.client_queues[client_id] = (deque(maxlen=self.max_queue_size), asyncio.Event())
+            self._rebuild_client_queue_list()
+            self._clients_present.set()
+            logger.info("客户端连接: %s (总数: %d)", client_id, len(self.clients))
         return self.client_queues[client_id]
     
     def remove_client(self, client_id: str):
@@ -50,15 +94,42 @@ class DataStreamer:
         if client_id in self.clients:
             self.clients.remove(client_id)
             if client_id in self.client_queues:
-                del self.client_queues[client_id]
-            logger.info(f"客户端断开: {client_id} (总数: {len(self.clients)})")
+                _, ready = self.client_queues.pop(client_id)
+                ready.set()  # 唤醒等待中的生成器，使其发现已被移除
+                self._rebuild_client_queue_list()
+            self.client_full_since.pop(client_id, None)
+            if not self.clients:
+                self._clients_present.clear()
+            logger.info("客户端断开: %s (总数: %d)", client_id, len(self.clients))
+    
+    def _rebuild_client_queue_list(self):
+        """重建广播用的客户端队列快照"""
+        self._client_queue_list = [
+            (client_id, queue, ready) for client_id, (queue, ready) in self.client_queues.items()
+        ]
     
     def get_client_count(self) -> int:
         """获取连接的客户端数量"""
         return len(self.clients)
     
-    async def broadcast_frame(self, fft_frame: FFTFrame, frame_time: float = None):
-        """广播FFT帧到所有客户端"""
+    @property
+    def has_clients(self) -> bool:
+        """是否有客户端连接"""
+        return bool(self.clients)
+    
+    async def wait_for_clients(self):
+        """等待直到至少有一个客户端连接"""
+        await self._clients_present.wait()
+    
+    def broadcast_frame(self, fft_frame: FFTFrame, now_ns: int = None):
+        """广播FFT帧到所有客户端
+        
+        只把帧放入各客户端的有界队列并唤醒其生成器，不等待任何客户端发送，
+        慢客户端不会拖慢处理循环（队列满时丢弃最旧帧，持续满载则断开）
+        
+        Args:
+            now_ns: 本帧的time.monotonic_ns()，用于帧率控制和统计，未传入时取当前时间
+        """
         if not self.clients:
             return
         
@@ -66,25 +137,47 @@ class DataStreamer:
         self.sequence_id += 1
         fft_frame.sequence_id = self.sequence_id
         
-        # 使用传入的时间戳或当前时间
-        current_time = frame_time if frame_time else time.time()
-        self.fps_history.append(current_time)
-        if len(self.fps_history) > 1:
-            time_span = self.fps_history[-1] - self.fps_history[0]
-            self.current_fps = (len(self.fps_history) - 1) / time_span if time_span > 0 else 0
+        # 使用传入的时间或当前时间（单调时钟，不受系统时间调整影响）
+        if not now_ns:
+            now_ns = time.monotonic_ns()
+        if self.last_frame_ns:
+            frame_interval = (now_ns - self.last_frame_ns) * 1e-9
+            if frame_interval > 0:
+                if self._ema_frame_interval:
+                    self._ema_frame_interval = 0.9 * self._ema_frame_interval + 0.1 * frame_interval
+                else:
+                    self._ema_frame_interval = frame_interval
+                self.current_fps = 1.0 / self._ema_frame_interval
             fft_frame.fps = self.current_fps
         
         # 准备SSE数据
         sse_data = self._prepare_sse_data(fft_frame)
         
         # 广播到所有客户端
+        # 循环中用到的属性先取到局部变量，避免每个客户端重复属性查找
         disconnected_clients = []
-        for client_id, queue in self.client_queues.items():
+        max_queue_size = self.max_queue_size
+        client_full_since = self.client_full_since
+        slow_client_timeout_ns = self.slow_client_timeout * 1_000_000_000
+        for client_id, queue, ready in self._client_queue_list:
             try:
-                # 非阻塞放入队列
-                queue.put_nowait(sse_data)
-            except asyncio.QueueFull:
-                logger.warning(f"客户端 {client_id} 队列已满，丢弃帧")
+                if len(queue) >= max_queue_size:
+                    full_since = client_full_since.setdefault(client_id, now_ns)
+                    if now_ns - full_since >= slow_client_timeout_ns:
+                        # 长时间消费不过来，断开慢客户端以免拖累内存和其他客户端
+                        logger.warning(f"客户端 {client_id} 队列持续满载 {self.slow_client_timeout}s，断开连接")
+                        self.slow_clients_total += 1
+                        disconnected_clients.append(client_id)
+                        continue
+                    # 有界deque会丢弃最旧的一帧，保留最新帧（实时数据以最新为准）；
+                    # 只在开始满载时记录一次，避免每帧输出
+                    if full_since == now_ns:
+                        logger.warning("客户端 %s 队列已满，开始丢弃最旧帧", client_id)
+                elif client_full_since:
+                    client_full_since.pop(client_id, None)
+                
+                queue.append(sse_data)
+                ready.set()
             except Exception as e:
                 logger.error(f"广播到客户端 {client_id} 失败: {e}")
                 disconnected_clients.append(client_id)
@@ -95,24 +188,30 @@ class DataStreamer:
         
         # 更新统计
         self.total_frames_sent += 1
-        self.total_bytes_sent += len(sse_data.encode('utf-8'))
-        self.last_frame_time = current_time
+        self.total_bytes_sent += len(sse_data)
+        self.last_frame_ns = now_ns
     
-    def _prepare_sse_data(self, fft_frame: FFTFrame) -> str:
+    def _prepare_sse_data(self, fft_frame: FFTFrame) -> bytes:
         """准备SSE数据格式"""
-        # 转为JSON
-        frame_json = fft_frame.json()
+        # 由pydantic-core直接序列化为UTF-8 JSON字节，每帧只做一次，所有客户端共享，
+        # 写出时无需再逐客户端编码
+        frame_json = to_json(fft_frame)
         
-        # SSE格式
-        return f"data: {frame_json}\n\n"
+        # SSE格式（join一次分配并复制，两次+拼接会把整帧复制两遍）
+        return b"".join((_SSE_PREFIX, frame_json, _SSE_SUFFIX))
     
-    async def create_client_stream(self, request: Request):
-        """为客户端创建SSE流"""
+    def create_client_stream(self, request: Request):
+        """为客户端创建SSE流
+
+        直接返回响应对象，客户端注册放在生成器首次迭代时进行，
+        使响应头先于任何准备工作发出
+        """
         client_id = f"{request.client.host}:{request.client.port}_{time.time()}"
-        client_queue = self.add_client(client_id)
         
         async def stream_generator():
             try:
+                client_queue, ready = self.add_client(client_id)
+                
                 # 发送连接确认
                 yield "data: " + json.dumps({
                     "type": "connected",
@@ -120,17 +219,34 @@ class DataStreamer:
                     "timestamp": time.time() * 1000,
                     "message": "连接成功"
                 }) + "\n\n"
+                await asyncio.sleep(0)
                 
                 # 持续发送数据
+                frames_since_check = 0
                 while True:
                     try:
                         # 等待数据，超时检查连接状态
-                        data = await asyncio.wait_for(client_queue.get(), timeout=30.0)
-                        yield data
+                        if not client_queue:
+                            ready.clear()
+                            await asyncio.wait_for(ready.wait(), timeout=30.0)
                         
-                        # 检查客户端是否断开
-                        if await request.is_disconnected():
+                        # 已被作为慢客户端断开
+                        if client_id not in self.clients:
                             break
+                        
+                        if not client_queue:
+                            continue
+                        
+                        yield client_queue.popleft()
+                        # 显式让出事件循环，使本帧尽快写出而不是与后续帧合并成突发
+                        await asyncio.sleep(0)
+                        
+                        # 定期检查客户端是否断开（每帧检查需要额外一次事件循环往返）
+                        frames_since_check += 1
+                        if frames_since_check >= DISCONNECT_CHECK_INTERVAL:
+                            frames_since_check = 0
+                            if await request.is_disconnected():
+                                break
                             
                     except asyncio.TimeoutError:
                         # 发送心跳
@@ -140,6 +256,9 @@ class DataStreamer:
                         }) + "\n\n"
                         yield heartbeat
                         
+                        if await request.is_disconnected():
+                            break
+                        
                     except Exception as e:
                         logger.error(f"客户端 {client_id} 流错误: {e}")
                         break
@@ -149,26 +268,21 @@ class DataStreamer:
             finally:
                 self.remove_client(client_id)
         
-        return StreamingResponse(
-            stream_generator(),
-            media_type="text/event-stream",
-            headers={
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Headers": "Cache-Control"
-            }
-        )
+        return EventSourceResponse(stream_generator(), headers=SSE_HEADERS)
     
-    def should_send_frame(self, current_time: float) -> bool:
-        """根据目标FPS判断是否应该发送帧"""
-        if self.last_frame_time == 0:
+    def should_send_frame(self, now_ns: int) -> bool:
+        """根据目标FPS判断是否应该发送帧（now_ns为time.monotonic_ns()）"""
+        if self.last_frame_ns == 0:
             return True
-            
-        time_since_last = current_time - self.last_frame_time
-        min_interval = 1.0 / self.config.target_fps
         
-        return time_since_last >= min_interval
+        return now_ns - self.last_frame_ns >= 1_000_000_000 // self.config.target_fps
+    
+    def time_until_next_frame(self, now_ns: int) -> float:
+        """距离按目标FPS可以发送下一帧还需等待的秒数（<=0 表示可以立即发送，now_ns为time.monotonic_ns()）"""
+        if self.last_frame_ns == 0:
+            return 0.0
+        
+        return (self.last_frame_ns + 1_000_000_000 // self.config.target_fps - now_ns) * 1e-9
     
     def update_config(self, new_config: StreamConfig):
         """更新流配置"""
@@ -188,6 +302,7 @@ class DataStreamer:
             "connected_clients": len(self.clients),
             "total_frames_sent": self.total_frames_sent,
             "total_bytes_sent": self.total_bytes_sent,
+            "slow_clients_total": self.slow_clients_total,
             "uptime_seconds": uptime,
             "current_fps": self.current_fps,
             "average_fps": avg_fps,
@@ -6,7 +6,9 @@
 import asyncio
 import logging
 import time
-from typing import Optional, Dict, Any, Callable
+from typing import Optional, Dict, Any, Callable, Tuple
+from concurrent.futures import Executor
+from dataclasses import dataclass, asdict
 from enum import Enum
 
 from .audio_capture import AudioCapture
@@ -24,6 +26,18 @@ class DeviceState(Enum):
     STOPPING = "stopping"
     ERROR = "error"
 
+@dataclass(slots=True)
+class DeviceStats:
+    """设备统计信息（每帧更新的计数器为普通属性，只在查询状态时转为字典）"""
+    frames_processed: int = 0
+    frames_sent: int = 0
+    errors_count: int = 0
+    uptime_seconds: float = 0.0
+    current_fps: float = 0.0
+    
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
 class DeviceInstance:
     """设备实例类 - 封装单个设备的完整音频处理链"""
     
@@ -33,7 +47,8 @@ class DeviceInstance:
         device_name: str,
         system_index: int,
         stream_config: StreamConfig,
-        audio_config: AudioConfig
+        audio_config: AudioConfig,
+        executor: Optional[Executor] = None
     ):
         """初始化设备实例
         
@@ -43,17 +58,21 @@ class DeviceInstance:
             system_index: 系统设备索引
             stream_config: 流配置
             audio_config: 音频配置
+            executor: 执行FFT和压缩的线程池，None时使用事件循环默认线程池
         """
         self.device_id = device_id
         self.device_name = device_name
         self.system_index = system_index
         self.stream_config = stream_config.copy()
         self.audio_config = audio_config.copy()
+        self._config_dict: Optional[Dict[str, Any]] = None  # get_status中配置部分的缓存，配置更新时失效
         
         # 状态管理
         self.state = DeviceState.STOPPED
         self.last_error = None
         self.start_time = None
+        self.stopped_event = asyncio.Event()  # 音频流关闭且处理任务结束后置位
+        self.stopped_event.set()
         
         # 组件实例
         self.audio_capture: Optional[AudioCapture] = None
@@ -63,15 +82,14 @@ class DeviceInstance:
         # 处理任务
         self.processing_task: Optional[asyncio.Task] = None
         self.sequence_id = 0
+        self._executor = executor
+        
+        # 缓冲区数据足够做一次FFT时由音频线程通知处理循环（代替轮询）
+        self._data_ready = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
         
         # 统计信息
-        self.stats = {
-            "frames_processed": 0,
-            "frames_sent": 0,
-            "errors_count": 0,
-            "uptime_seconds": 0.0,
-            "current_fps": 0.0
-        }
+        self.stats = DeviceStats()
         
         logger.info(f"设备实例已创建: {device_id} ({device_name})")
     
@@ -87,7 +105,8 @@ class DeviceInstance:
                 overlap=self.audio_config.overlap,
                 window_type=self.audio_config.window_type,
                 compression_level=self.stream_config.compression_level,
-                threshold_db=self.audio_config.threshold_db
+                threshold_db=self.audio_config.threshold_db,
+                fft_backend=self.audio_config.fft_backend
             )
             
             # 创建数据流管理器
@@ -104,6 +123,7 @@ class DeviceInstance:
             
             # 设置音频回调
             self.audio_capture.add_callback(self._audio_callback)
+            self.audio_capture.on_stream_closed = self._on_stream_closed
             
             logger.info(f"设备组件初始化完成: {self.device_id}")
             return True
@@ -121,6 +141,7 @@ class DeviceInstance:
             
         try:
             self.state = DeviceState.STARTING
+            self.stopped_event.clear()
             
             # 如果组件未初始化，先初始化
             if not self.audio_capture:
@@ -128,6 +149,7 @@ class DeviceInstance:
                     return False
             
             # 启动音频采集
+            self._loop = asyncio.get_running_loop()
             success = self.audio_capture.start()
             if not success:
                 self.state = DeviceState.ERROR
@@ -135,6 +157,7 @@ class DeviceInstance:
                 return False
             
             # 启动数据处理循环
+            self._data_ready.clear()
             self.processing_task = asyncio.create_task(self._data_processing_loop())
             
             self.state = DeviceState.RUNNING
@@ -170,6 +193,11 @@ class DeviceInstance:
                     pass
             
             self.state = DeviceState.STOPPED
+            # 音频流已关闭时立即置位；采集线程join超时仍未退出时，由其退出时的回调置位
+            if self.audio_capture is None or self.audio_capture.stream_closed.is_set():
+                self.stopped_event.set()
+            else:
+                logger.warning(f"音频流尚未关闭，等待采集线程退出: {self.device_id}")
             logger.info(f"设备已停止: {self.device_id}")
             
             return True
@@ -181,10 +209,53 @@ class DeviceInstance:
             return False
     
     def _audio_callback(self, audio_data, timestamp):
-        """音频数据回调"""
-        if self.fft_processor and self.state == DeviceState.RUNNING:
-            logger.debug(f"设备 {self.device_id} 音频回调: 数据长度={len(audio_data)}")
-            self.fft_processor.add_audio_data(audio_data)
+        """音频数据回调（在音频分发线程中按块调用：只写环形缓冲区，不记日志）"""
+        fft_processor = self.fft_processor
+        if fft_processor is not None and self.state is DeviceState.RUNNING:
+            fft_processor.add_audio_data(audio_data)
+            
+            # 数据足够时唤醒处理循环（需线程安全地切回事件循环；已置位时不重复投递）
+            if not self._data_ready.is_set() and fft_processor.can_process():
+                try:
+                    self._loop.call_soon_threadsafe(self._data_ready.set)
+                except RuntimeError:
+                    pass  # 事件循环已关闭
+    
+    def _on_stream_closed(self):
+        """音频流关闭回调（在采集线程中调用，切回事件循环处理）"""
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._mark_stopped_if_idle)
+            except RuntimeError:
+                pass  # 事件循环已关闭
+    
+    def _mark_stopped_if_idle(self):
+        """设备已停止时置位stopped_event（采集线程异常退出但设备仍在运行时不置位）"""
+        if self.state in (DeviceState.STOPPED, DeviceState.ERROR) and not self.stopped_event.is_set():
+            self.stopped_event.set()
+    
+    def _process_frame(self, data_format: str) -> Optional[Tuple[Dict[str, Any], Optional[Tuple[str, int, int, Optional[float], Optional[float]]]]]:
+        """处理一帧：FFT、智能跳帧检查和压缩（在线程池中执行，一次线程切换完成整帧的CPU工作）
+        
+        Returns:
+            None表示FFT处理失败；否则为(元数据, 压缩结果)，压缩结果为None表示被智能跳帧跳过
+        """
+        result = self.fft_processor.process_fft()
+        if result is None:
+            return None
+        
+        magnitude_db, metadata = result
+        
+        # 智能跳帧检查（可配置关闭）
+        if self.stream_config.enable_smart_skip and not self.fft_processor.should_send_frame(
+            magnitude_db,
+            self.stream_config.similarity_threshold,
+            self.stream_config.magnitude_threshold_db
+        ):
+            return metadata, None
+        
+        return metadata, self.fft_processor.compress_fft_data(magnitude_db, data_format)
     
     async def _data_processing_loop(self):
         """数据处理循环"""
@@ -201,49 +272,48 @@ class DeviceInstance:
                     client_count = len(self.data_streamer.clients) if self.data_streamer else 0
                     logger.debug(f"设备 {self.device_id} 处理循环 #{loop_count}: 缓冲区大小={buffer_stats.get('buffer_size', 0)}, 客户端数={client_count}")
                 
-                # 检查是否需要发送新帧
-                current_time = time.time()
-                should_send_time = self.data_streamer.should_send_frame(current_time)
+                # 没有客户端时不做FFT和压缩（帧反正无处可发），挂起到有客户端连接；
+                # 音频仍持续写入环形缓冲区，连接后从最新数据开始处理
+                if not self.data_streamer.has_clients:
+                    await self.data_streamer.wait_for_clients()
+                    continue
                 
-                if not should_send_time:
-                    await asyncio.sleep(0.001)
+                # 按目标FPS等待到下一帧的发送时间
+                now_ns = time.monotonic_ns()
+                delay = self.data_streamer.time_until_next_frame(now_ns)
+                if delay > 0:
+                    await asyncio.sleep(delay)
                     continue
                 
-                # 检查是否有足够数据处理FFT
-                can_process = self.fft_processor.can_process()
-                if not can_process:
-                    await asyncio.sleep(0.001)
+                # 等待音频线程通知有足够数据处理FFT（先清除再检查，避免丢失通知）
+                if not self.fft_processor.can_process():
+                    self._data_ready.clear()
+                    if not self.fft_processor.can_process():
+                        try:
+                            await asyncio.wait_for(self._data_ready.wait(), timeout=1.0)
+                        except asyncio.TimeoutError:
+                            pass
                     continue
                 
                 # 添加调试日志表示开始FFT处理
                 logger.debug(f"设备 {self.device_id} 开始FFT处理 (帧 #{self.sequence_id + 1})")
                 
-                # 处理FFT
-                result = self.fft_processor.process_fft()
+                # FFT、智能跳帧检查和压缩在线程池中执行（NumPy FFT和gzip会释放GIL，多设备可并行）
+                data_format = self.stream_config.data_format
+                result = await self._loop.run_in_executor(self._executor, self._process_frame, data_format)
                 if result is None:
                     logger.debug(f"设备 {self.device_id} FFT处理返回None")
                     continue
                 
-                magnitude_db, metadata = result
-                self.stats["frames_processed"] += 1
+                metadata, compressed = result
+                self.stats.frames_processed += 1
                 logger.debug(f"设备 {self.device_id} FFT处理成功，峰值频率={metadata['peak_frequency_hz']/1000:.1f}kHz")
                 
-                # 智能跳帧检查（可配置关闭）
-                should_send_smart = True
-                if self.stream_config.enable_smart_skip:
-                    should_send_smart = self.fft_processor.should_send_frame(
-                        magnitude_db,
-                        self.stream_config.similarity_threshold,
-                        self.stream_config.magnitude_threshold_db
-                    )
-                
-                if not should_send_smart:
+                if compressed is None:
                     logger.debug(f"设备 {self.device_id} 智能跳帧检查：跳过帧")
                     continue
                 
-                # 压缩数据
-                compressed_data, compressed_size, original_size = \
-                    self.fft_processor.compress_fft_data(magnitude_db)
+                compressed_data, compressed_size, original_size, db_min, db_scale = compressed
                 if not compressed_data:
                     logger.debug(f"设备 {self.device_id} 数据压缩失败")
                     continue
@@ -253,12 +323,15 @@ class DeviceInstance:
                 # 创建FFT帧
                 self.sequence_id += 1
                 fft_frame = FFTFrame(
-                    timestamp=current_time * 1000,
+                    timestamp=time.time() * 1000,
                     sequence_id=self.sequence_id,
                     sample_rate=self.audio_config.sample_rate,
                     fft_size=self.audio_config.fft_size,
                     data_compressed=compressed_data,
                     compression_method="gzip",
+                    data_format=data_format,
+                    db_min=db_min,
+                    db_scale=db_scale,
                     data_size_bytes=compressed_size,
                     original_size_bytes=original_size,
                     peak_frequency_hz=metadata["peak_frequency_hz"],
@@ -269,18 +342,15 @@ class DeviceInstance:
                 
                 # 广播到客户端
                 logger.debug(f"设备 {self.device_id} 准备广播帧 #{self.sequence_id}")
-                await self.data_streamer.broadcast_frame(fft_frame, current_time)
-                self.stats["frames_sent"] += 1
+                self.data_streamer.broadcast_frame(fft_frame, now_ns)
+                self.stats.frames_sent += 1
                 logger.debug(f"设备 {self.device_id} 帧 #{self.sequence_id} 广播完成")
                 
-                # 小延迟避免CPU过载
-                await asyncio.sleep(0.001)
-                
         except asyncio.CancelledError:
             logger.info(f"设备 {self.device_id} 数据处理循环已停止")
         except Exception as e:
             self.last_error = str(e)
-            self.stats["errors_count"] += 1
+            self.stats.errors_count += 1
             logger.error(f"设备 {self.device_id} 数据处理循环出错: {e}")
             self.state = DeviceState.ERROR
     
@@ -288,7 +358,7 @@ class DeviceInstance:
         """获取设备状态"""
         # 更新运行时间
         if self.start_time:
-            self.stats["uptime_seconds"] = time.time() - self.start_time
+            self.stats.uptime_seconds = time.time() - self.start_time
         
         # 获取组件统计
         audio_stats = self.audio_capture.get_stats() if self.audio_capture else {}
@@ -301,19 +371,26 @@ class DeviceInstance:
             "system_index": self.system_index,
             "state": self.state.value,
             "last_error": self.last_error,
-            "stats": self.stats,
+            "stats": self.stats.as_dict(),
             "audio_stats": audio_stats,
             "fft_stats": fft_stats,
             "stream_stats": stream_stats,
-            "config": {
-                "stream": self.stream_config.dict(),
-                "audio": self.audio_config.dict()
-            }
+            "config": self._get_config_dict()
         }
     
+    def _get_config_dict(self) -> Dict[str, Any]:
+        """序列化后的配置，只在配置更新后重新生成（调用方不应修改返回的字典）"""
+        if self._config_dict is None:
+            self._config_dict = {
+                "stream": self.stream_config.model_dump(),
+                "audio": self.audio_config.model_dump()
+            }
+        return self._config_dict
+    
     def update_stream_config(self, new_config: StreamConfig):
         """更新流配置"""
         self.stream_config = new_config.copy()
+        self._config_dict = None
         if self.data_streamer:
             self.data_streamer.update_config(new_config)
         logger.info(f"设备 {self.device_id} 流配置已更新")
@@ -321,16 +398,19 @@ class DeviceInstance:
     def update_audio_config(self, new_config: AudioConfig):
         """更新音频配置（需要重启设备）"""
         self.audio_config = new_config.copy()
+        self._config_dict = None
         logger.info(f"设备 {self.device_id} 音频配置已更新（需重启生效）")
     
-    async def get_stream_generator(self, request):
-        """获取SSE流生成器"""
+    def get_stream_generator(self, request):
+        """获取SSE流响应（客户端在流开始后才注册）"""
         if not self.data_streamer:
             raise RuntimeError(f"设备 {self.device_id} 数据流未初始化")
         
-        return await self.data_streamer.create_client_stream(request)
+        return self.data_streamer.create_client_stream(request)
     
-    def __del__(self):
-        """析构函数"""
-        if self.processing_task and not self.processing_task.done():
-            self.processing_task.cancel()
\ No newline at end of file
+    async def aclose(self):
+        """停止设备并释放处理组件（在事件循环中显式调用，代替析构时取消任务）"""
+        await self.stop()
+        self.audio_capture = None
+        self.fft_processor = None
+        self.data_streamer = None
\ No newline at end of file
@@ -5,7 +5,9 @@
 """
 import asyncio
 import logging
+import os
 import time
+from collections import Counter
 from typing import Dict, Optional, List, Any, Tuple
 from concurrent.futures import ThreadPoolExecutor
 
@@ -31,11 +33,18 @@ class DeviceInstanceManager:
         self.device_id_manager = device_id_manager
         self.device_instances: Dict[str, DeviceInstance] = {}
         self.running_devices: Dict[str, str] = {}  # system_index -> device_id 映射
+        self._device_info_by_id: Dict[str, Dict[str, Any]] = {}  # 最近一次枚举结果的 stable_id 索引
         
         # 资源管理
         self.max_concurrent_devices = 8  # 最大并发设备数
         self.resource_monitor_task: Optional[asyncio.Task] = None
         
+        # 所有设备共享的FFT/压缩线程池
+        self.fft_executor = ThreadPoolExecutor(
+            max_workers=min(self.max_concurrent_devices, os.cpu_count() or 1),
+            thread_name_prefix="fft"
+        )
+        
         # 统计信息
         self.total_devices_created = 0
         self.total_devices_started = 0
@@ -60,55 +69,87 @@ class DeviceInstanceManager:
             self.resource_monitor_task = None
             logger.info("资源监控任务已停止")
     
-    def get_available_devices(self) -> List[Dict[str, Any]]:
-        """获取可用设备列表"""
-        try:
-            import sounddevice as sd
-            devices = sd.query_devices()
+    def _probe_devices(self) -> Tuple[List[dict], Dict[int, str], int, Dict[int, bool]]:
+        """枚举系统设备、分配稳定ID并检查各输入设备可用性
+        
+        全部是阻塞的PortAudio调用（以及映射文件写入），可在线程中执行；不访问设备实例
+        
+        Returns:
+            (设备列表, {system_index: stable_id}, 默认输入设备索引, {system_index: 输入设置是否可用})
+        """
+        import sounddevice as sd
+        devices = sd.query_devices()
+        
+        # 一次性清理丢失映射并分配稳定ID
+        id_for_index, _ = self.device_id_manager.snapshot(devices)
+        
+        # 循环外解析一次默认输入设备索引
+        default_input_index = sd.default.device[0] if hasattr(sd.default, 'device') else -1
+        
+        # 检查设备可用性
+        input_ok = {}
+        for i in id_for_index:
+            try:
+                sd.check_input_settings(device=i, channels=1, samplerate=devices[i]['default_samplerate'])
+                input_ok[i] = True
+            except Exception:
+                input_ok[i] = False
+        
+        return devices, id_for_index, default_input_index, input_ok
+    
+    def _build_available_devices(self, probe) -> List[Dict[str, Any]]:
+        """根据枚举结果和当前设备实例状态生成可用设备列表"""
+        devices, id_for_index, default_input_index, input_ok = probe
+        
+        available_devices = []
+        for i, stable_id in id_for_index.items():
+            device = devices[i]
             
-            # 清理不存在的设备映射
-            self.device_id_manager.cleanup_missing_devices(devices)
+            # 检查设备状态
+            device_status = "available"
+            instance_state = None
             
-            available_devices = []
-            for i, device in enumerate(devices):
-                if device['max_input_channels'] > 0:
-                    stable_id, _ = self.device_id_manager.get_or_create_device_id(device, i)
-                    
-                    # 检查设备状态
-                    device_status = "available"
-                    instance_state = None
-                    
-                    if stable_id in self.device_instances:
-                        instance = self.device_instances[stable_id]
-                        instance_state = instance.state.value
-                        
-                        if instance.state == DeviceState.RUNNING:
-                            device_status = "running"
-                        elif instance.state == DeviceState.ERROR:
-                            device_status = "error"
-                        else:
-                            device_status = "stopped"
-                    
-                    # 检查设备可用性
-                    try:
-                        sd.check_input_settings(device=i, channels=1, samplerate=device['default_samplerate'])
-                    except Exception:
-                        if device_status == "available":
-                            device_status = "unavailable"
-                    
-                    available_devices.append({
-                        "id": stable_id,
-                        "name": device['name'],
-                        "system_index": i,
-                        "max_channels": device['max_input_channels'],
-                        "default_samplerate": device['default_samplerate'],
-                        "status": device_status,
-                        "instance_state": instance_state,
-                        "is_default": i == sd.default.device[0] if hasattr(sd.default, 'device') else False
-                    })
+            instance = self.device_instances.get(stable_id)
+            if instance is not None:
+                instance_state = instance.state.value
+                
+                if instance.state == DeviceState.RUNNING:
+                    device_status = "running"
+                elif instance.state == DeviceState.ERROR:
+                    device_status = "error"
+                else:
+                    device_status = "stopped"
             
-            return available_devices
+            if not input_ok[i] and device_status == "available":
+                device_status = "unavailable"
             
+            available_devices.append({
+                "id": stable_id,
+                "name": device['name'],
+                "system_index": i,
+                "max_channels": device['max_input_channels'],
+                "default_samplerate": device['default_samplerate'],
+                "status": device_status,
+                "instance_state": instance_state,
+                "is_default": i == default_input_index
+            })
+        
+        self._device_info_by_id = {device["id"]: device for device in available_devices}
+        return available_devices
+    
+    def get_available_devices(self) -> List[Dict[str, Any]]:
+        """获取可用设备列表"""
+        try:
+            return self._build_available_devices(self._probe_devices())
+        except Exception as e:
+            logger.error(f"获取可用设备失败: {e}")
+            return []
+    
+    async def get_available_devices_async(self) -> List[Dict[str, Any]]:
+        """获取可用设备列表（PortAudio枚举在线程中执行，不阻塞事件循环）"""
+        try:
+            probe = await asyncio.to_thread(self._probe_devices)
+            return self._build_available_devices(probe)
         except Exception as e:
             logger.error(f"获取可用设备失败: {e}")
             return []
@@ -156,7 +197,8 @@ class DeviceInstanceManager:
             device_name=device['name'],
             system_index=system_index,
             stream_config=stream_config,
-            audio_config=audio_config
+            audio_config=audio_config,
+            executor=self.fft_executor
         )
         
         self.device_instances[device_id] = instance
@@ -183,9 +225,11 @@ class DeviceInstanceManager:
         
         instance = self.device_instances[device_id]
         
-        # 检查资源限制
-        running_count = len([d for d in self.device_instances.values() 
-                           if d.state == DeviceState.RUNNING])
+        # 检查资源限制（启动中的设备也计入，避免并发启动时超出上限）
+        running_count = sum(
+            1 for d in self.device_instances.values()
+            if d.state is DeviceState.RUNNING or d.state is DeviceState.STARTING
+        )
         
         if running_count >= self.max_concurrent_devices:
             raise DeviceConflictError(f"已达到最大并发设备数限制: {self.max_concurrent_devices}")
@@ -260,6 +304,10 @@ class DeviceInstanceManager:
         
         return True
     
+    def get_available_device_info(self, device_id: str) -> Optional[Dict[str, Any]]:
+        """从最近一次 get_available_devices 的结果中按稳定ID查找设备信息"""
+        return self._device_info_by_id.get(device_id)
+    
     def get_device_instance(self, device_id: str) -> Optional[DeviceInstance]:
         """获取设备实例"""
         return self.device_instances.get(device_id)
@@ -269,13 +317,15 @@ class DeviceInstanceManager:
         return self.device_instances.copy()
     
     async def stop_all_devices(self):
-        """停止所有设备"""
-        tasks = []
-        for device_id in list(self.device_instances.keys()):
-            tasks.append(self.stop_device(device_id))
+        """停止所有设备
         
-        if tasks:
-            await asyncio.gather(*tasks, return_exceptions=True)
+        用gather(return_exceptions=True)而不是TaskGroup：单个设备停止失败时不应取消其他设备的停止
+        """
+        if self.device_instances:
+            await asyncio.gather(
+                *(self.stop_device(device_id) for device_id in self.device_instances),
+                return_exceptions=True
+            )
             logger.info("所有设备已停止")
     
     async def cleanup_error_devices(self):
@@ -285,9 +335,19 @@ class DeviceInstanceManager:
             if instance.state == DeviceState.ERROR
         ]
         
-        for device_id in error_devices:
-            await self.remove_device_instance(device_id)
-            logger.info(f"已清理错误设备: {device_id}")
+        if not error_devices:
+            return
+        
+        # 各设备的停止和移除互不依赖，并发执行
+        results = await asyncio.gather(
+            *(self.remove_device_instance(device_id) for device_id in error_devices),
+            return_exceptions=True
+        )
+        for device_id, result in zip(error_devices, results):
+            if isinstance(result, Exception):
+                logger.error(f"清理错误设备失败: {device_id}, 错误: {result}")
+            else:
+                logger.info(f"已清理错误设备: {device_id}")
     
     async def _resource_monitor_loop(self):
         """资源监控循环"""
@@ -322,13 +382,17 @@ class DeviceInstanceManager:
     
     def get_manager_stats(self) -> Dict[str, Any]:
         """获取管理器统计信息"""
-        running_devices = [d for d in self.device_instances.values() if d.state == DeviceState.RUNNING]
-        error_devices = [d for d in self.device_instances.values() if d.state == DeviceState.ERROR]
+        # 一次遍历同时得到各设备状态和按状态的计数
+        device_states = {
+            device_id: instance.state
+            for device_id, instance in self.device_instances.items()
+        }
+        state_counts = Counter(device_states.values())
         
         return {
             "total_instances": len(self.device_instances),
-            "running_instances": len(running_devices),
-            "error_instances": len(error_devices),
+            "running_instances": state_counts[DeviceState.RUNNING],
+            "error_instances": state_counts[DeviceState.ERROR],
             "max_concurrent_devices": self.max_concurrent_devices,
             "total_devices_created": self.total_devices_created,
             "total_devices_started": self.total_devices_started,
@@ -336,8 +400,7 @@ class DeviceInstanceManager:
             "resource_monitor_active": self.resource_monitor_task is not None and not self.resource_monitor_task.done(),
             "running_device_mapping": self.running_devices.copy(),
             "device_states": {
-                device_id: instance.state.value 
-                for device_id, instance in self.device_instances.items()
+                device_id: state.value for device_id, state in device_states.items()
             }
         }
     
@@ -348,11 +411,17 @@ class DeviceInstanceManager:
         # 停止资源监控
         await self.stop_monitoring()
         
-        # 停止所有设备
-        await self.stop_all_devices()
+        # 停止并关闭所有设备实例
+        instances = list(self.device_instances.values())
+        if instances:
+            await asyncio.gather(*(instance.aclose() for instance in instances), return_exceptions=True)
+            logger.info("所有设备已停止")
         
         # 清理所有实例
         self.device_instances.clear()
         self.running_devices.clear()
         
+        # 关闭FFT线程池（设备均已停止，不再有待执行的任务）
+        self.fft_executor.shutdown(wait=False)
+        
         logger.info("设备实例管理器已关闭")
\ No newline at end of file
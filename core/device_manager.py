@@ -3,15 +3,25 @@
 设备ID管理器
 提供稳定的设备标识符映射和持久化存储
 """
-import json
 import hashlib
 import logging
 import os
+import threading
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 
+import orjson
+
 logger = logging.getLogger(__name__)
 
+@lru_cache(maxsize=256)
+def _signature_for(name: str, hostapi: int, max_input_channels: int, default_samplerate: float) -> str:
+    """由设备关键字段计算签名（同一设备每次枚举字段相同，结果按字段缓存）"""
+    signature_string = f"{name}|{hostapi}|{max_input_channels}|{default_samplerate}"
+    signature_hash = hashlib.sha256(signature_string.encode()).hexdigest()[:12]
+    return f"sig_{signature_hash}"
+
 class DeviceIDManager:
     """设备ID管理器，负责生成和维护稳定的设备标识符"""
     
@@ -28,6 +38,7 @@ class DeviceIDManager:
         self.config_file = self.config_dir / "device_mapping.json"
         self.device_mapping = {}  # stable_id -> device_signature
         self.reverse_mapping = {}  # device_signature -> stable_id
+        self._lock = threading.RLock()  # 保护映射的读改写
         self.load_mapping()
         
     def generate_device_signature(self, device: dict, system_index: int) -> str:
@@ -40,22 +51,13 @@ class DeviceIDManager:
         Returns:
             设备签名字符串
         """
-        # 提取关键设备信息
-        key_info = {
-            "name": device.get('name', ''),
-            "hostapi": device.get('hostapi', 0),
-            "max_input_channels": device.get('max_input_channels', 0),
-            "max_output_channels": device.get('max_output_channels', 0),
-            "default_samplerate": device.get('default_samplerate', 0)
-        }
-        
-        # 创建设备签名
-        signature_string = f"{key_info['name']}|{key_info['hostapi']}|{key_info['max_input_channels']}|{key_info['default_samplerate']}"
-        
-        # 生成哈希
-        signature_hash = hashlib.sha256(signature_string.encode()).hexdigest()[:12]
-        
-        return f"sig_{signature_hash}"
+        # 提取关键设备信息生成签名（哈希结果按字段缓存）
+        return _signature_for(
+            device.get('name', ''),
+            device.get('hostapi', 0),
+            device.get('max_input_channels', 0),
+            device.get('default_samplerate', 0)
+        )
     
     def generate_stable_id(self, device_signature: str, device_name: str) -> str:
         """为设备签名生成稳定ID
@@ -95,22 +97,58 @@ class DeviceIDManager:
         """
         device_signature = self.generate_device_signature(device, system_index)
         
-        # 检查是否已有映射
-        if device_signature in self.reverse_mapping:
-            stable_id = self.reverse_mapping[device_signature]
-            logger.debug(f"找到现有设备映射: {device['name']} -> {stable_id}")
-        else:
-            # 创建新映射
-            stable_id = self.generate_stable_id(device_signature, device['name'])
-            self.device_mapping[stable_id] = device_signature
-            self.reverse_mapping[device_signature] = stable_id
-            logger.info(f"创建新设备映射: {device['name']} -> {stable_id}")
-            
-            # 保存映射
-            self.save_mapping()
+        with self._lock:
+            # 检查是否已有映射
+            if device_signature in self.reverse_mapping:
+                stable_id = self.reverse_mapping[device_signature]
+                logger.debug(f"找到现有设备映射: {device['name']} -> {stable_id}")
+            else:
+                # 创建新映射
+                stable_id = self._add_mapping(device_signature, device['name'])
+                
+                # 保存映射
+                self.save_mapping()
             
         return stable_id, system_index
     
+    def _add_mapping(self, device_signature: str, device_name: str) -> str:
+        """为新设备签名分配稳定ID并登记映射（调用方需持有锁）"""
+        stable_id = self.generate_stable_id(device_signature, device_name)
+        self.device_mapping[stable_id] = device_signature
+        self.reverse_mapping[device_signature] = stable_id
+        logger.info(f"创建新设备映射: {device_name} -> {stable_id}")
+        return stable_id
+    
+    def snapshot(self, devices: List[dict]) -> Tuple[Dict[int, str], Dict]:
+        """一次加锁完成映射清理和所有输入设备的稳定ID分配
+        
+        Args:
+            devices: 当前系统设备列表
+            
+        Returns:
+            ({system_index: stable_id}, 映射统计信息)
+        """
+        signatures = [self.generate_device_signature(device, i) for i, device in enumerate(devices)]
+        
+        with self._lock:
+            changed = self._remove_missing(set(signatures))
+            
+            id_for_index = {}
+            for i, (device, device_signature) in enumerate(zip(devices, signatures)):
+                if device['max_input_channels'] <= 0:
+                    continue
+                stable_id = self.reverse_mapping.get(device_signature)
+                if stable_id is None:
+                    stable_id = self._add_mapping(device_signature, device['name'])
+                    changed = True
+                id_for_index[i] = stable_id
+            
+            # 有变化时只保存一次
+            if changed:
+                self.save_mapping()
+            
+            return id_for_index, self.get_mapping_stats()
+    
     def get_device_by_stable_id(self, stable_id: str, devices_list: List[dict]) -> Optional[Tuple[dict, int]]:
         """通过稳定ID找到对应的设备
         
@@ -139,9 +177,8 @@ class DeviceIDManager:
         """从文件加载设备映射"""
         try:
             if self.config_file.exists():
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    
+                data = orjson.loads(self.config_file.read_bytes())
+                
                 self.device_mapping = data.get('device_mapping', {})
                 self.reverse_mapping = data.get('reverse_mapping', {})
                 
@@ -172,11 +209,10 @@ class DeviceIDManager:
                 'description': 'Audio device stable ID mapping for headless_ultrasonic'
             }
             
-            # 原子写入
+            # 先整体序列化再一次写入临时文件，然后原子替换（缩进格式与json.dump(indent=2)相同）
+            payload = orjson.dumps(data, option=orjson.OPT_INDENT_2)
             temp_file = self.config_file.with_suffix('.tmp')
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-                
+            temp_file.write_bytes(payload)
             temp_file.replace(self.config_file)
             logger.debug(f"设备映射已保存到: {self.config_file}")
             
@@ -194,26 +230,31 @@ class DeviceIDManager:
         Args:
             current_devices: 当前系统设备列表
         """
-        current_signatures = set()
-        for i, device in enumerate(current_devices):
-            signature = self.generate_device_signature(device, i)
-            current_signatures.add(signature)
-            
-        # 找出不再存在的设备
-        missing_signatures = set(self.reverse_mapping.keys()) - current_signatures
+        current_signatures = {
+            self.generate_device_signature(device, i) for i, device in enumerate(current_devices)
+        }
+        
+        with self._lock:
+            if self._remove_missing(current_signatures):
+                self.save_mapping()
+    
+    def _remove_missing(self, current_signatures: set) -> bool:
+        """移除不在当前签名集合中的映射（调用方需持有锁）
+        
+        Returns:
+            是否有映射被移除
+        """
+        # 找出不再存在的设备（键视图直接做集合差，不先复制成set）
+        missing_signatures = self.reverse_mapping.keys() - current_signatures
         
         if missing_signatures:
             logger.info(f"清理 {len(missing_signatures)} 个丢失的设备映射")
             
             for signature in missing_signatures:
-                if signature in self.reverse_mapping:
-                    stable_id = self.reverse_mapping[signature]
-                    del self.reverse_mapping[signature]
-                    if stable_id in self.device_mapping:
-                        del self.device_mapping[stable_id]
-                        
-            if missing_signatures:
-                self.save_mapping()
+                stable_id = self.reverse_mapping.pop(signature)
+                self.device_mapping.pop(stable_id, None)
+        
+        return bool(missing_signatures)
     
     def get_mapping_stats(self) -> Dict:
         """获取映射统计信息"""
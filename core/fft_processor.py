@@ -5,8 +5,15 @@ FFT处理和数据压缩模块
 """
 import numpy as np
 from scipy.signal import get_window
+import scipy.fft
+
+try:
+    import pyfftw  # 可选：fft_backend="pyfftw" 时使用FFTW3
+except ImportError:
+    pyfftw = None
 from collections import deque
-import gzip
+from functools import lru_cache
+import zlib
 import base64
 import time
 import logging
@@ -14,6 +21,21 @@ from typing import Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# uint8量化的dB范围：下限取dB阈值（低于阈值的值已被钳到阈值），上限0dB映射到255；
+# 默认阈值-100dB时步长约0.39dB。阈值不低于上限时退回QUANT_DB_MIN
+QUANT_DB_MIN = -120.0
+QUANT_DB_MAX = 0.0
+
+# NumPy 2.0 起 np.fft.rfft 支持 out 参数，可直接写入预分配的输出缓冲区
+_RFFT_SUPPORTS_OUT = np.lib.NumpyVersion(np.__version__) >= "2.0.0"
+
+@lru_cache(maxsize=16)
+def _cached_window(window_type: str, fft_size: int) -> np.ndarray:
+    """窗函数系数只取决于类型和大小，同参数的处理器（多设备、设备重启）共享同一只读数组"""
+    window = np.ascontiguousarray(get_window(window_type, fft_size))
+    window.setflags(write=False)
+    return window
+
 class FFTProcessor:
     """FFT处理器"""
     
@@ -23,7 +45,8 @@ class FFTProcessor:
                  overlap: float = 0.75,
                  window_type: str = "hann",
                  compression_level: int = 6,
-                 threshold_db: float = -100.0):
+                 threshold_db: float = -100.0,
+                 fft_backend: str = "numpy"):
         
         self.sample_rate = sample_rate
         self.fft_size = fft_size
@@ -31,12 +54,49 @@ class FFTProcessor:
         self.window_type = window_type
         self.compression_level = compression_level
         self.threshold_db = threshold_db
+        if fft_backend == "pyfftw" and pyfftw is None:
+            logger.warning("未安装pyfftw，FFT实现回退为numpy")
+            fft_backend = "numpy"
+        self.fft_backend = fft_backend
+        
+        # 窗函数（只读共享，只乘到FFT输入缓冲区上，环形缓冲区中保持原始样本）
+        self.window = _cached_window(window_type, fft_size)
+        
+        # 音频数据环形缓冲区（单生产者单消费者，无锁）
+        # 音频分发线程只写_ring_head，FFT线程只写_ring_tail；最多保留fft_size*2个最新样本，
+        # 容量取2的幂且留足余量，生产者写入的位置不会覆盖消费者正在读取的最近样本
+        self._ring_limit = fft_size * 2
+        ring_size = 1 << (self._ring_limit * 4 - 1).bit_length()
+        self._ring = np.zeros(ring_size, dtype=np.float32)
+        self._ring_mask = ring_size - 1
+        self._ring_head = 0  # 累计写入样本数
+        self._ring_tail = 0  # 累计消费样本数
+        self._frame_buf = np.empty(fft_size, dtype=np.float32)
+        
+        # FFT输入/输出和dB幅度的预分配缓冲区，每帧复用，避免热路径上的内存分配
+        self._fft_plan = None
+        if fft_backend == "pyfftw":
+            # 对齐缓冲区上的持久FFTW计划，初始化时规划一次（MEASURE会覆写缓冲区，此时尚无数据）
+            self._fft_in = pyfftw.empty_aligned(fft_size, dtype=np.float64)
+            self._fft_out = pyfftw.empty_aligned(fft_size // 2 + 1, dtype=np.complex128)
+            self._fft_plan = pyfftw.FFTW(self._fft_in, self._fft_out, flags=('FFTW_MEASURE',), threads=1)
+        else:
+            self._fft_in = np.empty(fft_size, dtype=np.float64)
+            self._fft_out = np.empty(fft_size // 2 + 1, dtype=np.complex128)
+        # dB链路用float32：最终输出就是float32，log10等ufunc在float32上走SIMD，比float64快约3倍
+        self._magnitude_db = np.empty(fft_size // 2 + 1, dtype=np.float32)
         
-        # 创建窗函数
-        self.window = get_window(window_type, fft_size)
+        # uint8量化的预分配缓冲区
+        self._quant_scratch = np.empty(fft_size // 2 + 1, dtype=np.float32)
+        self._quantized = np.empty(fft_size // 2 + 1, dtype=np.uint8)
         
-        # 音频数据缓冲区
-        self.audio_buffer = deque(maxlen=fft_size * 2)
+        # 预初始化的gzip压缩器模板（wbits=31输出gzip格式），每帧copy()一份，省去重复初始化
+        self._gzip_template = None
+        self._gzip_template_level = None
+        
+        # 上一次压缩的原始字节和结果，内容完全相同时直接复用（静止场景下频谱常逐字节相同）
+        self._last_payload = None
+        self._last_compressed = None
         
         # 频率轴
         self.freqs = np.fft.rfftfreq(fft_size, 1/sample_rate)
@@ -45,7 +105,12 @@ class FFTProcessor:
         # 性能统计
         self.frames_processed = 0
         self.total_processing_time = 0.0
-        self.last_fft_data = None
+        
+        # 智能跳帧：上一帧去均值后的频谱及其范数（两块缓冲区交替使用）
+        self._prev_centered = np.empty(fft_size // 2 + 1, dtype=np.float32)
+        self._cur_centered = np.empty(fft_size // 2 + 1, dtype=np.float32)
+        self._prev_norm = 0.0
+        self._has_prev_frame = False
         
         # SPL历史用于平滑
         self.spl_history = deque(maxlen=30)
@@ -54,67 +119,109 @@ class FFTProcessor:
         logger.info(f"  采样率: {sample_rate} Hz")
         logger.info(f"  FFT大小: {fft_size}")
         logger.info(f"  窗函数: {window_type}")
+        logger.info(f"  FFT实现: {fft_backend}")
         logger.info(f"  dB阈值: {threshold_db} dB (低于此值将被忽略)")
         logger.info(f"  频率分辨率: {sample_rate/fft_size:.2f} Hz")
         logger.info(f"  Nyquist频率: {sample_rate/2/1000:.1f} kHz")
         logger.info(f"  输出频率点数: {len(self.freq_khz)}")
     
     def add_audio_data(self, audio_data: np.ndarray):
-        """添加音频数据到缓冲区"""
-        self.audio_buffer.extend(audio_data)
+        """添加音频数据到缓冲区（只由音频分发线程调用）"""
+        audio_data = np.ravel(audio_data)
+        n = audio_data.size
+        if n > self._ring_limit:
+            # 超出保留上限的部分反正会被丢弃，只写入最新的样本
+            audio_data = audio_data[-self._ring_limit:]
+            n = self._ring_limit
+        
+        head = self._ring_head
+        start = head & self._ring_mask
+        first = min(n, self._ring.size - start)
+        self._ring[start:start + first] = audio_data[:first]
+        if first < n:
+            self._ring[:n - first] = audio_data[first:]
+        # 数据写完后再发布新的head
+        self._ring_head = head + n
+    
+    def _buffered(self) -> int:
+        """缓冲区中可用的样本数（超出保留上限的旧样本视为已丢弃）"""
+        return min(self._ring_head - self._ring_tail, self._ring_limit)
     
     def can_process(self) -> bool:
         """检查是否有足够数据进行FFT"""
-        return len(self.audio_buffer) >= self.fft_size
+        return self._buffered() >= self.fft_size
     
     def process_fft(self) -> Optional[Tuple[np.ndarray, dict]]:
         """处理FFT并返回结果和元数据"""
         if not self.can_process():
             return None
             
-        start_time = time.time()
+        start_time = time.perf_counter()
+        
+        # 计算步长（考虑重叠）
+        hop_size = int(self.fft_size * (1 - self.overlap))
+        
+        # 从缓冲区开头取FFT大小的数据（跳过超出保留上限、已被丢弃的旧样本）
+        tail = max(self._ring_tail, self._ring_head - self._ring_limit)
         
         try:
-            # 计算步长（考虑重叠）
-            hop_size = int(self.fft_size * (1 - self.overlap))
-            
-            # 获取FFT大小的数据从缓冲区开头
-            data = np.array(list(self.audio_buffer)[:self.fft_size])
-            
-            # 移除已处理的数据（移除hop_size个样本以实现重叠）
-            for _ in range(hop_size):
-                if len(self.audio_buffer) > 0:
-                    self.audio_buffer.popleft()
+            # 不跨越环形缓冲区末尾时直接使用视图（零拷贝），跨越时才拼接到帧缓冲区
+            start = tail & self._ring_mask
+            end = start + self.fft_size
+            if end <= self._ring.size:
+                data = self._ring[start:end]
+            else:
+                first = self._ring.size - start
+                data = self._frame_buf
+                data[:first] = self._ring[start:]
+                data[first:] = self._ring[:self.fft_size - first]
             
             # 应用窗函数
-            windowed_data = data * self.window
+            windowed_data = np.multiply(data, self.window, out=self._fft_in)
             
-            # FFT
-            fft_result = np.fft.rfft(windowed_data)
+            # FFT（scipy后端单线程原地变换：多设备已经在线程池中并行）
+            if self._fft_plan is not None:
+                fft_result = self._fft_plan()
+            elif self.fft_backend == "scipy":
+                fft_result = scipy.fft.rfft(windowed_data, overwrite_x=True, workers=1)
+            elif _RFFT_SUPPORTS_OUT:
+                fft_result = np.fft.rfft(windowed_data, out=self._fft_out)
+            else:
+                fft_result = np.fft.rfft(windowed_data)
             
             # 转换为dB - 使用与simple_ultrasonic.py相同的方法
-            # 直接从FFT结果计算，不使用功率谱
-            magnitude_db = 20 * np.log10(np.abs(fft_result) / self.fft_size + 1e-10)
+            # 直接从FFT结果计算，不使用功率谱（各步骤原地写入预分配缓冲区）
+            magnitude_db = np.abs(fft_result, out=self._magnitude_db, casting='unsafe')
+            magnitude_db /= self.fft_size
+            magnitude_db += 1e-10
+            np.log10(magnitude_db, out=magnitude_db)
+            magnitude_db *= 20
             
             # 应用窗函数补偿
             magnitude_db += 6.0  # Hann窗的能量补偿 (20*log10(2) ≈ 6dB)
             
             # 应用dB阈值过滤 - 将低于阈值的值设为阈值
-            magnitude_db = np.maximum(magnitude_db, self.threshold_db)
+            np.maximum(magnitude_db, self.threshold_db, out=magnitude_db)
             
             # 计算元数据
             metadata = self._calculate_metadata(magnitude_db, data)
             
-            # 更新统计
+            # 更新统计（单调时钟计时，只取一次结束时间）
+            processing_time = time.perf_counter() - start_time
+            metadata["processing_time_ms"] = processing_time * 1000
             self.frames_processed += 1
-            self.total_processing_time += time.time() - start_time
-            self.last_fft_data = magnitude_db
+            self.total_processing_time += processing_time
             
-            return magnitude_db.astype(np.float32), metadata
+            return magnitude_db.copy(), metadata
             
         except Exception as e:
             logger.error(f"FFT处理出错: {e}")
             return None
+        finally:
+            # 最后一次读取data（窗函数和SPL计算）之后才移除已处理的数据（前进hop_size个样本以实现重叠）。
+            # 写入方不等待tail，视图data只在本次处理期间写入少于 ring.size - 2*fft_size 个样本时有效
+            # （容量至少为保留上限的4倍，约6*fft_size个样本的余量）；处理停顿超过这个时长时帧数据会混入新样本
+            self._ring_tail = tail + hop_size
     
     def _calculate_metadata(self, magnitude_db: np.ndarray, audio_data: np.ndarray) -> dict:
         """计算FFT元数据"""
@@ -126,19 +233,20 @@ class FFTProcessor:
         # 计算SPL
         spl = self._calculate_spl(audio_data)
         self.spl_history.append(spl)
-        avg_spl = np.mean(list(self.spl_history)) if self.spl_history else spl
+        # 历史只有30个标量，纯Python求和比转list再np.mean快一个数量级
+        avg_spl = sum(self.spl_history) / len(self.spl_history)
         
         return {
             "peak_frequency_hz": float(peak_freq),
             "peak_magnitude_db": float(peak_magnitude), 
             "spl_db": float(avg_spl),
-            "processing_time_ms": (time.time() * 1000) - (time.time() * 1000)  # 实际会在调用时计算
+            "processing_time_ms": 0.0  # 由 process_fft 填入实际耗时
         }
     
     def _calculate_spl(self, audio_data: np.ndarray) -> float:
         """计算声压级 (SPL)"""
-        # 计算RMS值
-        rms = np.sqrt(np.mean(audio_data**2))
+        # 计算RMS值（点积一次完成平方和，不生成audio_data**2临时数组）
+        rms = np.sqrt(np.dot(audio_data, audio_data) / audio_data.size)
         
         # 转换为dB SPL
         if rms > 0:
@@ -148,29 +256,79 @@ class FFTProcessor:
         
         return max(0.0, spl_db)
     
-    def compress_fft_data(self, magnitude_db: np.ndarray) -> Tuple[str, int, int]:
+    def quantization_params(self, data_format: str) -> Tuple[Optional[float], Optional[float]]:
+        """返回FFTFrame的(db_min, db_scale)，非量化格式为(None, None)"""
+        if data_format != "uint8":
+            return None, None
+        db_min = self.threshold_db if self.threshold_db < QUANT_DB_MAX else QUANT_DB_MIN
+        return db_min, (QUANT_DB_MAX - db_min) / 255.0
+    
+    def quantize_db(self, magnitude_db: np.ndarray, db_min: float, db_scale: float) -> np.ndarray:
+        """将dB幅度量化为uint8（dB = db_min + 值 * db_scale，参数由quantization_params给出）
+        
+        返回的数组为复用的内部缓冲区，下一次调用前有效
+        """
+        scratch = self._quant_scratch
+        if scratch.shape != magnitude_db.shape:
+            scratch = self._quant_scratch = np.empty(magnitude_db.shape, dtype=np.float32)
+            self._quantized = np.empty(magnitude_db.shape, dtype=np.uint8)
+        
+        np.subtract(magnitude_db, db_min, out=scratch, casting='unsafe')
+        scratch *= 1.0 / db_scale
+        np.clip(scratch, 0, 255, out=scratch)
+        np.rint(scratch, out=scratch)
+        np.copyto(self._quantized, scratch, casting='unsafe')
+        return self._quantized
+    
+    def compress_fft_data(self, magnitude_db: np.ndarray,
+                          data_format: str = "float32"
+                          ) -> Tuple[str, int, int, Optional[float], Optional[float]]:
         """压缩FFT数据
         
+        Args:
+            data_format: "float32"原样传输，"uint8"先量化再压缩
+        
         Returns:
-            (compressed_base64, compressed_size, original_size)
+            (compressed_base64, compressed_size, original_size, db_min, db_scale)
+            db_min/db_scale为本帧量化实际使用的参数（非uint8格式为None），
+            与数据一起返回，避免阈值在压缩后被修改导致帧头与数据不一致
         """
         try:
+            # 量化参数只读取一次，量化和帧头使用同一组值
+            db_min, db_scale = self.quantization_params(data_format)
+            
             # 转为字节数据
-            original_bytes = magnitude_db.astype(np.float32).tobytes()
+            if data_format == "uint8":
+                original_bytes = self.quantize_db(magnitude_db, db_min, db_scale).tobytes()
+            else:
+                original_bytes = magnitude_db.astype(np.float32).tobytes()
             original_size = len(original_bytes)
             
-            # gzip压缩
-            compressed_bytes = gzip.compress(original_bytes, compresslevel=self.compression_level)
+            # 与上一帧逐字节相同（且压缩级别和量化参数未变）时复用缓存结果，跳过gzip和Base64
+            last = self._last_compressed
+            if (original_bytes == self._last_payload
+                    and self._gzip_template_level == self.compression_level
+                    and last[3] == db_min and last[4] == db_scale):
+                return last
+            
+            # gzip压缩：每帧都是独立完整的gzip流，客户端中途接入也能单独解压
+            if self._gzip_template_level != self.compression_level:
+                self._gzip_template = zlib.compressobj(self.compression_level, zlib.DEFLATED, 31)
+                self._gzip_template_level = self.compression_level
+            compressor = self._gzip_template.copy()
+            compressed_bytes = compressor.compress(original_bytes) + compressor.flush()
             compressed_size = len(compressed_bytes)
             
             # Base64编码
             compressed_base64 = base64.b64encode(compressed_bytes).decode('ascii')
             
-            return compressed_base64, compressed_size, original_size
+            self._last_payload = original_bytes
+            self._last_compressed = (compressed_base64, compressed_size, original_size, db_min, db_scale)
+            return self._last_compressed
             
         except Exception as e:
             logger.error(f"FFT数据压缩出错: {e}")
-            return "", 0, 0
+            return "", 0, 0, None, None
     
     def should_send_frame(self, current_fft: np.ndarray, 
                          similarity_threshold: float = 0.95,
@@ -182,19 +340,33 @@ class FFTProcessor:
         if max_magnitude < magnitude_threshold_db:
             return False
         
-        # 检查与上一帧的相似度
-        if self.last_fft_data is not None:
-            try:
-                correlation_matrix = np.corrcoef(current_fft, self.last_fft_data)
-                similarity = correlation_matrix[0, 1] if correlation_matrix.shape == (2, 2) else 0
+        # 检查与上一帧的相似度（皮尔逊相关系数，与np.corrcoef一致）
+        try:
+            if self._cur_centered.shape != current_fft.shape:
+                self._cur_centered = np.empty(current_fft.shape, dtype=np.float32)
+                self._has_prev_frame = False
+            
+            # 去均值后写入预分配缓冲区，上一帧的范数已缓存，每帧只需两次点积
+            centered = self._cur_centered
+            np.subtract(current_fft, current_fft.mean(), out=centered, casting='unsafe')
+            norm = float(np.sqrt(np.dot(centered, centered)))
+            
+            similar = False
+            if self._has_prev_frame and norm > 0 and self._prev_norm > 0:
+                similarity = float(np.dot(centered, self._prev_centered)) / (norm * self._prev_norm)
+                similar = similarity > similarity_threshold
+            
+            # 当前帧成为下一次比较的参考帧
+            self._cur_centered, self._prev_centered = self._prev_centered, centered
+            self._prev_norm = norm
+            self._has_prev_frame = True
+            
+            if similar:
+                return False  # 太相似，跳过
                 
-                if similarity > similarity_threshold:
-                    return False  # 太相似，跳过
-                    
-            except Exception as e:
-                logger.debug(f"相似度计算出错: {e}")
-                # 计算失败时默认发送
-                pass
+        except Exception as e:
+            logger.debug(f"相似度计算出错: {e}")
+            # 计算失败时默认发送
         
         return True
     
@@ -208,7 +380,7 @@ class FFTProcessor:
         return {
             "frames_processed": self.frames_processed,
             "average_processing_time_ms": avg_processing_time * 1000,
-            "buffer_size": len(self.audio_buffer),
+            "buffer_size": self._buffered(),
             "buffer_ready": self.can_process(),
             "sample_rate": self.sample_rate,
             "fft_size": self.fft_size,
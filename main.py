@@ -37,10 +37,10 @@ from api.config import router as config_router
 from api.device_control import router as device_control_router
 from api.system_control import router as system_control_router
 from api.stream import set_data_streamer
+from api.responses import NPResponse
+from api.system_control import start_cpu_sampler, stop_cpu_sampler
 from api.control import set_components
 from api.config import set_config_components
-from api.device_control import set_device_manager
-from api.system_control import set_device_manager as set_system_device_manager
 
 # 配置日志
 logging.basicConfig(
@@ -65,14 +65,14 @@ processing_task = None
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     # 启动时初始化组件
-    await startup_event()
+    await startup_event(app)
     
     yield
     
     # 关闭时清理资源
     await shutdown_event()
 
-async def startup_event():
+async def startup_event(app: FastAPI):
     """启动事件：初始化所有组件"""
     global device_id_manager, device_instance_manager
     global audio_capture, fft_processor, data_streamer, stream_config, audio_config, processing_task
@@ -88,9 +88,11 @@ async def startup_event():
         # 启动设备实例管理器的监控任务
         await device_instance_manager.start_monitoring()
         
-        # 设置新架构API组件引用
-        set_device_manager(device_instance_manager)
-        set_system_device_manager(device_instance_manager)
+        # 新架构API通过依赖项从app.state获取设备管理器
+        app.state.device_manager = device_instance_manager
+        
+        # 后台采样CPU占用，供性能端点读取
+        start_cpu_sampler()
         
         logger.info("新设备管理系统已初始化")
         
@@ -109,7 +111,8 @@ async def startup_event():
             overlap=audio_config.overlap,
             window_type=audio_config.window_type,
             compression_level=stream_config.compression_level,
-            threshold_db=audio_config.threshold_db
+            threshold_db=audio_config.threshold_db,
+            fft_backend=audio_config.fft_backend
         )
         
         data_streamer = DataStreamer(stream_config)
@@ -178,6 +181,8 @@ async def shutdown_event():
                 await processing_task
             except asyncio.CancelledError:
                 pass
+        
+        await stop_cpu_sampler()
                 
         logger.info("应用已清理完成")
         
@@ -187,7 +192,6 @@ async def shutdown_event():
 def audio_callback(audio_data, timestamp):
     """音频数据回调"""
     if fft_processor:
-        logger.debug(f"音频回调: 数据长度={len(audio_data)}, 时间戳={timestamp}")
         fft_processor.add_audio_data(audio_data)
 
 async def data_processing_loop():
@@ -204,9 +208,14 @@ async def data_processing_loop():
                 buffer_stats = fft_processor.get_stats()
                 logger.debug(f"处理循环 #{loop_count}: 缓冲区大小={buffer_stats['buffer_size']}, 可处理={buffer_stats['buffer_ready']}")
             
+            # 没有客户端时跳过FFT和压缩，等待客户端连接
+            if not data_streamer.has_clients:
+                await data_streamer.wait_for_clients()
+                continue
+            
             # 先检查是否需要发送新帧
-            current_time = time.time()
-            should_send_time = data_streamer.should_send_frame(current_time)
+            now_ns = time.monotonic_ns()
+            should_send_time = data_streamer.should_send_frame(now_ns)
             
             # 如果还不需要发送新帧，就不进行FFT处理
             if not should_send_time:
@@ -242,20 +251,26 @@ async def data_processing_loop():
             if not should_send_smart:
                 continue
             
-            # 压缩数据
-            compressed_data, compressed_size, original_size = fft_processor.compress_fft_data(magnitude_db)
+            # 压缩数据（放到线程中执行，避免阻塞事件循环）
+            data_format = stream_config.data_format
+            compressed_data, compressed_size, original_size, db_min, db_scale = await asyncio.to_thread(
+                fft_processor.compress_fft_data, magnitude_db, data_format
+            )
             if not compressed_data:
                 continue
             
             # 创建FFT帧
             sequence_id += 1
             fft_frame = FFTFrame(
-                timestamp=current_time * 1000,  # 毫秒时间戳
+                timestamp=time.time() * 1000,  # 毫秒时间戳（Unix时间）
                 sequence_id=sequence_id,
                 sample_rate=audio_config.sample_rate,
                 fft_size=audio_config.fft_size,
                 data_compressed=compressed_data,
                 compression_method="gzip",
+                data_format=data_format,
+                db_min=db_min,
+                db_scale=db_scale,
                 data_size_bytes=compressed_size,
                 original_size_bytes=original_size,
                 peak_frequency_hz=metadata["peak_frequency_hz"],
@@ -266,7 +281,7 @@ async def data_processing_loop():
             
             # 广播到所有客户端（传递时间戳以保持时序一致性）
             logger.debug(f"准备广播帧 #{sequence_id} 到客户端")
-            await data_streamer.broadcast_frame(fft_frame, current_time)
+            data_streamer.broadcast_frame(fft_frame, now_ns)
             logger.debug(f"广播完成帧 #{sequence_id}")
             
             # 小延迟避免CPU过载
@@ -277,11 +292,33 @@ async def data_processing_loop():
     except Exception as e:
         logger.error(f"数据处理循环出错: {e}")
 
+def select_server_impl():
+    """选择uvicorn的事件循环与HTTP解析实现，优先uvloop + httptools
+    
+    显式导入也让PyInstaller能够打包这两个模块；Windows下没有uvloop，回退到asyncio
+    """
+    try:
+        import uvloop  # noqa: F401
+        import uvicorn.loops.uvloop  # noqa: F401
+        loop_impl = "uvloop"
+    except ImportError:
+        loop_impl = "asyncio"
+    
+    try:
+        import httptools  # noqa: F401
+        import uvicorn.protocols.http.httptools_impl  # noqa: F401
+        http_impl = "httptools"
+    except ImportError:
+        http_impl = "h11"
+    
+    return loop_impl, http_impl
+
 # 创建FastAPI应用
 app = FastAPI(
     title="Headless超声波可视化器",
     description="基于FastAPI + SSE的实时FFT数据流服务",
     version="1.0.0",
+    default_response_class=NPResponse,
     lifespan=lifespan
 )
 
@@ -682,7 +719,7 @@ async def root():
             }
             
             // 解压缩FFT数据 (优化性能版本)
-            function decompressFFTData(compressedData) {
+            function decompressFFTData(compressedData, fftFrame) {
                 try {
                     const binaryString = atob(compressedData);
                     const bytes = new Uint8Array(binaryString.length);
@@ -690,6 +727,14 @@ async def root():
                         bytes[i] = binaryString.charCodeAt(i);
                     }
                     const decompressed = pako.inflate(bytes);
+                    // uint8量化格式：dB = db_min + 值 * db_scale
+                    if (fftFrame && fftFrame.data_format === 'uint8') {
+                        const out = new Float32Array(decompressed.length);
+                        for (let i = 0; i < decompressed.length; i++) {
+                            out[i] = fftFrame.db_min + decompressed[i] * fftFrame.db_scale;
+                        }
+                        return out;
+                    }
                     return new Float32Array(decompressed.buffer);
                 } catch (e) {
                     console.error('❌ 解压缩失败:', e);
@@ -741,7 +786,7 @@ async def root():
                         }
                         
                         // 解压缩FFT数据 (移除调试日志提高性能)
-                        const fftData = decompressFFTData(fftFrame.data_compressed);
+                        const fftData = decompressFFTData(fftFrame.data_compressed, fftFrame);
                         if (!fftData) {
                             console.error('❌ 解压缩失败');
                             return;
@@ -1322,10 +1367,15 @@ if __name__ == "__main__":
     # 必须添加这行以支持PyInstaller编译
     multiprocessing.freeze_support()
     
+    loop_impl, http_impl = select_server_impl()
+    logger.info(f"事件循环: {loop_impl}, HTTP解析: {http_impl}")
+    
     uvicorn.run(
         app,  # 直接传递app对象而不是字符串
         host=Config.HOST,
         port=Config.PORT,
+        loop=loop_impl,
+        http=http_impl,
         reload=False,  # 编译后必须禁用reload
         workers=1,     # 编译后只能使用1个worker
         log_level=Config.LOG_LEVEL.lower()
@@ -3,8 +3,8 @@
 数据模型定义
 """
 from pydantic import BaseModel
-from typing import Optional, List
-from datetime import datetime
+from typing import Optional, List, Literal
+from time import time_ns
 import numpy as np
 
 class FFTFrame(BaseModel):
@@ -15,6 +15,9 @@ class FFTFrame(BaseModel):
     fft_size: int                      # FFT大小
     data_compressed: str               # Base64编码的压缩FFT数据
     compression_method: str = "gzip"   # 压缩方法
+    data_format: str = "float32"       # 解压后的数据格式: float32 或 uint8（量化dB）
+    db_min: Optional[float] = None     # uint8格式: dB = db_min + 值 * db_scale
+    db_scale: Optional[float] = None   # uint8格式: 每个量化步长对应的dB
     data_size_bytes: int              # 压缩后数据大小
     original_size_bytes: int          # 原始数据大小
     
@@ -34,6 +37,7 @@ class StreamConfig(BaseModel):
     magnitude_threshold_db: float = -80.0  # 幅度阈值，低于此值不发送
     enable_smart_skip: bool = False   # 智能跳帧（相似帧跳过）- 默认禁用以确保在安静环境中也能看到数据
     similarity_threshold: float = 0.95 # 相似度阈值
+    data_format: Literal["float32", "uint8"] = "float32"  # 传输格式: float32 或 uint8（阈值..0dB量化为0..255，数据量减为1/4）
 
 class AudioConfig(BaseModel):
     """音频配置"""
@@ -46,6 +50,7 @@ class AudioConfig(BaseModel):
     overlap: float = 0.75
     window_type: str = "hann"
     threshold_db: float = -100.0      # dB阈值，低于此值将被忽略
+    fft_backend: Literal["numpy", "scipy", "pyfftw"] = "numpy"  # FFT实现: numpy.fft、scipy.fft（大FFT尺寸更快）或 pyfftw（需另行安装）
 
 class SystemStatus(BaseModel):
     """系统状态"""
@@ -64,14 +69,14 @@ class ControlResponse(BaseModel):
     """控制响应"""
     status: str = "success"
     message: Optional[str] = None
-    timestamp: float
+    timestamp: int                      # Unix时间戳（整数毫秒，与api.responses.now_ms一致）
     
     @classmethod
     def success(cls, message: str = None) -> "ControlResponse":
         return cls(
             status="success",
             message=message,
-            timestamp=datetime.now().timestamp() * 1000
+            timestamp=time_ns() // 1_000_000
         )
     
     @classmethod
@@ -79,5 +84,5 @@ class ControlResponse(BaseModel):
         return cls(
             status="error", 
             message=message,
-            timestamp=datetime.now().timestamp() * 1000
+            timestamp=time_ns() // 1_000_000
         )
\ No newline at end of file
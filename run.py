@@ -4,16 +4,21 @@
 """
 import uvicorn
 from config import Config
+from main import select_server_impl
 
 if __name__ == "__main__":
     print("🎵 启动Headless超声波可视化器...")
     print(f"服务器地址: http://{Config.HOST}:{Config.PORT}")
     print("按 Ctrl+C 停止服务")
     
+    loop_impl, http_impl = select_server_impl()
+    
     uvicorn.run(
         "main:app",
         host=Config.HOST,
         port=Config.PORT,
+        loop=loop_impl,
+        http=http_impl,
         reload=Config.DEBUG,
         log_level=Config.LOG_LEVEL.lower()
     )
\ No newline at end of file